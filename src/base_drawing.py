@@ -1,10 +1,24 @@
 import argparse
+import copy
+import multiprocessing
+import os
+import random
 import time
 
 import logging
+import matplotlib.pyplot as plt
+import numpy as np
+
+from cache import DrawingCache, cache_key
+from estimator import PlotTimeEstimator
+from pipeline import PlotPipeline
 from plotter import Plotter
 import util
 
+# Colors of the inks that color drawings are split into, in the order that
+# util.rgb2cmyk returns them, as matplotlib knows them
+PROCESS_COLORS = ["cyan", "magenta", "yellow", "black"]
+
 class BaseDrawing(object):
     """To make a new drawing, subclass this and implement the four functions"""
 
@@ -17,6 +31,77 @@ class BaseDrawing(object):
         self.parser.add_argument('--dry-run', dest='dryrun',
                                  action='store_true')
         self.parser.set_defaults(dryrun=False)
+        self.parser.add_argument('--buffered', dest='buffered',
+                                 action='store_true',
+                                 help="Send commands to the plotter in "
+                                 "batches instead of one at a time")
+        self.parser.set_defaults(buffered=False)
+        self.parser.add_argument('--encoding', choices=["PD", "PE"],
+                                 default="PD",
+                                 help="Send lines as plain PD commands, or "
+                                 "as compact PE commands on HP-GL/2 "
+                                 "plotters.  Files written with --output "
+                                 "always use PD")
+        self.parser.add_argument('--output', type=str, default=None,
+                                 help="Write the HPGL to this file instead "
+                                 "of the plotter, for playback.py to send "
+                                 "later")
+        self.parser.add_argument('--pipeline', dest='pipeline',
+                                 action='store_true',
+                                 help="Send lines to the plotter from a "
+                                 "separate thread, a chunk at a time, while "
+                                 "the next chunk is put on the page")
+        self.parser.set_defaults(pipeline=False)
+        self.parser.add_argument('--handshake',
+                                 choices=["none", "xonxoff", "rtscts"],
+                                 default="none",
+                                 help="Serial handshake to use with the "
+                                 "plotter, instead of asking it whether it's "
+                                 "ready for more")
+        self.parser.add_argument('--timeout', type=float, default=5.0,
+                                 help="Seconds to wait for the plotter to "
+                                 "answer before giving up")
+        self.parser.add_argument('--metrics', type=str, default=None,
+                                 help="Write counts of what was sent to the "
+                                 "plotter, and time spent waiting on it, to "
+                                 "this file as JSON")
+        self.parser.add_argument('--trace-every', dest='trace_every',
+                                 type=int, default=1,
+                                 help="With --verbose, only log every Nth "
+                                 "command sent to the plotter")
+        self.parser.add_argument('--simplify', type=float, default=1.0,
+                                 help="Leave out points that move lines by "
+                                 "less than this many plotter units "
+                                 "(0.025mm).  0 sends every point")
+        self.parser.add_argument('--seed', type=int, default=None,
+                                 help="Seed the random number generators so "
+                                 "that a drawing can be repeated exactly")
+        self.parser.add_argument('--batch', type=str, default=None,
+                                 metavar="DIR",
+                                 help="Don't ask about or plot anything, just "
+                                 "save a preview and the HPGL of each drawing "
+                                 "to this directory")
+        self.parser.add_argument('--count', type=int, default=1,
+                                 help="With --batch, how many drawings to "
+                                 "make, seeded --seed, --seed+1, ...")
+        self.parser.add_argument('--workers', type=int, default=None,
+                                 help="How many processes to make drawings, "
+                                 "or parts of a drawing, in.  Defaults to "
+                                 "one per CPU")
+        self.parser.add_argument('--preview-format', dest='preview_format',
+                                 choices=["png", "svg"], default="png")
+        self.parser.add_argument('--no-cache', dest='no_cache',
+                                 action='store_true',
+                                 help="Always work the drawing out again, "
+                                 "even if it was seeded the same way before")
+        self.parser.set_defaults(no_cache=False)
+        self.parser.add_argument('--cache-dir', dest='cache_dir', type=str,
+                                 default="~/.cache/voronize",
+                                 help="Where to keep worked out drawings")
+        self.parser.add_argument('--cache-size', dest='cache_size', type=int,
+                                 default=2048,
+                                 help="Megabytes of drawings to keep before "
+                                 "the least recently used are deleted")
 
         self.get_command_line_args()
 
@@ -24,23 +109,217 @@ class BaseDrawing(object):
 
         util.init_logger(verbose=self.args.verbose)
 
-        self.data = self.perform_computations()
+        if self.args.seed is not None:
+            logging.info("Seeding random number generators with {}".format(
+                self.args.seed))
+            random.seed(self.args.seed)
+            np.random.seed(self.args.seed)
+
+        if self.args.batch is not None:
+            self.run_batch()
+            return
+
+        self.data = self.load_or_compute()
 
         self.display_image()
+        self.estimate_plot_time()
+        self.save_to_cache()
         res = input("Do you want to keep this one? [y/n]: ")
         keep = res in ["y", "Y"]
 
         if keep is True:
             start = time.time()
             with Plotter(verbose=self.args.verbose,
-                         dryrun=self.args.dryrun) as self.p:
-                self.plot_image()
+                         dryrun=self.args.dryrun,
+                         buffered=self.args.buffered,
+                         encoding=self.args.encoding,
+                         output=self.args.output,
+                         handshake=self.args.handshake,
+                         timeout=self.args.timeout,
+                         metrics=self.args.metrics,
+                         trace_every=self.args.trace_every,
+                         simplify=self.args.simplify) as plotter:
+                if self.args.pipeline is True:
+                    with PlotPipeline(plotter) as self.p:
+                        self.plot_image()
+                else:
+                    self.p = plotter
+                    self.plot_image()
             end = time.time()
             logging.info("Drawing took {}s".format((end-start)))
         else:
             logging.debug("Discarding image")
 
 
+    def __getstate__(self):
+        """Drawings are sent to worker processes in batch mode.  The parser
+        can't be pickled and isn't needed there."""
+        state = self.__dict__.copy()
+        state.pop("parser", None)
+        state.pop("p", None)
+        return state
+
+
+    def run_batch(self):
+        """Make --count drawings without asking anything, in parallel, and save
+        each one's preview and HPGL.  A drawing that's wanted can then be sent
+        to the plotter with playback.py without working it out again."""
+        os.makedirs(self.args.batch, exist_ok=True)
+
+        first = self.args.seed
+        if first is None:
+            first = random.randrange(2**31)
+        seeds = list(range(first, first + self.args.count))
+        logging.info("Making {} drawings with seeds {} to {}".format(
+            len(seeds), seeds[0], seeds[-1]))
+
+        if len(seeds) == 1 or self.args.workers == 1:
+            names = [self.render_candidate(seed) for seed in seeds]
+        else:
+            pool = multiprocessing.Pool(self.args.workers)
+            try:
+                names = pool.map(self.render_candidate, seeds)
+            finally:
+                pool.close()
+                pool.join()
+
+        for name in names:
+            logging.info("Saved {}".format(name))
+
+
+    def render_candidate(self, seed):
+        """Make the drawing for one seed, and save its preview and HPGL.
+        Returns the path the files were saved under, without an extension."""
+        plt.switch_backend("Agg")
+        random.seed(seed)
+        np.random.seed(seed)
+        self.args.seed = seed
+
+        name = os.path.join(self.args.batch, "{}-{}".format(
+            type(self).__name__, seed))
+
+        self.data = self.load_or_compute()
+        self.display_image()
+        plt.gcf().savefig("{}.{}".format(name, self.args.preview_format))
+        plt.close("all")
+
+        with Plotter(encoding=self.args.encoding, output=name + ".hpgl",
+                     simplify=self.args.simplify) as self.p:
+            self.plot_image()
+        self.save_to_cache()
+        return name
+
+
+    def _cache(self):
+        """The cache, or None if it shouldn't be used.  Only seeded drawings
+        are cached, since an unseeded one is meant to come out differently
+        every time."""
+        if self.args.no_cache or self.args.seed is None:
+            return None
+        return DrawingCache(self.args.cache_dir,
+                            max_bytes=self.args.cache_size * 1024**2)
+
+
+    def load_or_compute(self):
+        """Return the results of perform_computations, from the cache if this
+        drawing has been worked out with the same arguments, seed and input
+        files before"""
+        cache = self._cache()
+        if cache is not None:
+            data = cache.load(cache_key(type(self).__name__, self.args))
+            if data is not None:
+                self._cached_keys = set(data)
+                return data
+        self._cached_keys = None
+        return self.perform_computations()
+
+
+    def save_to_cache(self):
+        """Store self.data, including anything plot_image added to it, so the
+        next run with the same arguments can skip straight to drawing"""
+        cache = self._cache()
+        if cache is None or self._cached_keys == set(self.data):
+            return
+        cache.store(cache_key(type(self).__name__, self.args), self.data)
+
+
+    def add_color_arguments(self):
+        """Drawings made from an image call this from get_command_line_args to
+        be able to draw color images with several pens"""
+        self.parser.add_argument('--cmyk', dest='cmyk', action='store_true',
+                                 help="Split a color image into cyan, "
+                                 "magenta, yellow and black, and draw each "
+                                 "with its own pen")
+        self.parser.set_defaults(cmyk=False)
+        self.parser.add_argument('--pens', type=str, default="1,2,3,4",
+                                 help="With --cmyk, the pens holding cyan, "
+                                 "magenta, yellow and black ink")
+
+
+    def compute_layers(self, images):
+        """Work out a layer of the drawing from each of `images`, one per pen,
+        in parallel.  The result goes in self.data in place of a single
+        layer's data.  Which pen draws each layer is only looked up when
+        it's drawn, so a cached drawing can be redrawn with other pens."""
+        self._pens(len(images))
+        layers = util.parallel_map(self._compute_seeded_layer,
+                                   enumerate(images),
+                                   workers=self.args.workers)
+        for layer, color in zip(layers, PROCESS_COLORS):
+            if layer is None:
+                logging.info("Nothing to draw in {}, leaving its pen "
+                             "out".format(color))
+        return {"layers": layers}
+
+
+    def _pens(self, count):
+        """The pens given with --pens, checking there's one for each of
+        `count` layers"""
+        pens = [int(pen) for pen in self.args.pens.split(",")]
+        if len(pens) != count:
+            raise ValueError("Need {} pens, got {}".format(count, len(pens)))
+        return pens
+
+
+    def _compute_seeded_layer(self, job):
+        """Compute a layer with its own seed, so that layers don't all place
+        their points in the same places"""
+        index, image = job
+        args = self.args
+        self.args = copy.copy(args)
+        if args.seed is not None:
+            self.args.seed = args.seed + index
+            random.seed(self.args.seed)
+            np.random.seed(self.args.seed)
+        try:
+            return self.compute_layer(image)
+        finally:
+            self.args = args
+
+
+    def layers(self):
+        """A list of (pen, data, color) for each layer of the drawing.  A
+        drawing that wasn't split up by color is one layer, drawn in black
+        with pen 1.  Layers compute_layer had nothing to draw in, which it
+        returns None for, are left out."""
+        if "layers" not in self.data:
+            return [(1, self.data, "k")]
+        layers = self.data["layers"]
+        return [(pen, data, color) for pen, data, color
+                in zip(self._pens(len(layers)), layers, PROCESS_COLORS)
+                if data is not None]
+
+
+    def estimate_plot_time(self):
+        """Run plot_image without a plotter to find out how long the real thing
+        will take"""
+        estimator = PlotTimeEstimator(buffered=self.args.buffered)
+        with Plotter(encoding=self.args.encoding, output=estimator,
+                     simplify=self.args.simplify) as self.p:
+            self.plot_image()
+        logging.info("Estimated plot time: {}".format(estimator.summary()))
+
+
     def get_command_line_args(self):
         """Implement a function that mutates `self.parser` with any command
         line parameters that are necessary for this specific drawing
@@ -57,6 +336,15 @@ class BaseDrawing(object):
                                   "function")
 
 
+    def compute_layer(self, image):
+        """Drawings that can be split up by color implement this to work out
+        one layer from an image_ingest.ImageSource of it, and return its data
+        as perform_computations would, or None if there's nothing to draw
+        """
+        raise NotImplementedError("You must implement the compute_layer "
+                                  "function to draw in color")
+
+
     def display_image(self):
         """Show an image so the user can select whether to keep it."""
         raise NotImplementedError("You must implement the display_image "
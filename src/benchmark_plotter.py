@@ -0,0 +1,76 @@
+"""Time how long it takes to send a drawing to a simulated HP7475A using each
+of the ways Plotter can talk to it.  The drawing is a random scribble made of
+short connected runs, a bit like the output of the path optimizer.
+
+Times are in the simulated plotter's virtual clock, so they are what the real
+plotter would take, not how long this script takes to run.
+"""
+import argparse
+import logging
+
+import numpy as np
+
+from plotter import Plotter
+from simulated_plotter import SimulatedPlotter
+import util
+
+STRATEGIES = [
+    ("unbuffered PD", dict(buffered=False, encoding="PD")),
+    ("buffered PD", dict(buffered=True, encoding="PD")),
+    ("buffered PE", dict(buffered=True, encoding="PE")),
+]
+
+
+def make_polylines(count, length, seed=None):
+    """Random walks of `length` steps, scattered across an A4 page"""
+    rs = np.random.RandomState(seed)
+    starts = rs.uniform([0, 0], [11040, 7721], size=(count, 1, 2))
+    steps = rs.normal(scale=40, size=(count, length, 2))
+    lines = starts + np.cumsum(steps, axis=1)
+    return np.clip(lines, 0, [11040, 7721])
+
+
+def run(polylines, gpib=True, model=b"7475A", baudrate=9600, **kwargs):
+    device = SimulatedPlotter(baudrate=baudrate, model=model, gpib=gpib)
+    with Plotter(device=device, gpib=gpib, **kwargs) as p:
+        for line in polylines:
+            p.write_polyline(line)
+    device.finish()
+    return device
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=500)
+    parser.add_argument("--length", type=int, default=20)
+    parser.add_argument("--baudrate", type=int, default=9600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rs232", dest="gpib", action="store_false",
+                        help="Simulate a direct serial connection rather "
+                        "than the GPIB controller")
+    parser.set_defaults(gpib=True)
+    parser.add_argument('--hpgl2', dest='model', action='store_const',
+                        const=b"7550A", default=b"7475A",
+                        help="Simulate a plotter that understands PE")
+    parser.add_argument('--verbose', dest='verbose', action='store_true')
+    parser.set_defaults(verbose=False)
+    args = parser.parse_args()
+
+    util.init_logger(verbose=args.verbose)
+    if args.verbose is False:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    polylines = make_polylines(args.lines, args.length, seed=args.seed)
+
+    print("{:<16}{:>12}{:>12}{:>12}{:>12}".format(
+        "strategy", "time (s)", "bytes", "stall (s)", "lost bytes"))
+    for name, kwargs in STRATEGIES:
+        device = run(polylines, gpib=args.gpib, model=args.model,
+                     baudrate=args.baudrate, **kwargs)
+        print("{:<16}{:>12.1f}{:>12}{:>12.1f}{:>12}".format(
+            name, device.clock, device.stats["bytes_written"],
+            device.stats["stall_time"], device.stats["lost_bytes"]))
+
+
+if __name__ == "__main__":
+    main()
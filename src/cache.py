@@ -0,0 +1,187 @@
+"""Keep the results of perform_computations() around between runs.
+
+Results are filed under a hash of everything that went into them: the
+drawing, its command line arguments (less the ones that only affect how it's
+plotted), its seed, and the contents of any input files.  Each result is one
+compressed .npz file in the cache directory.  When the directory grows past
+its size limit the least recently used results are deleted.
+
+Most things in self.data are numpy arrays and are stored as they are.  A
+scipy Voronoi tessellation is stored as its arrays and comes back as a
+CachedVoronoi, which has the same attributes but doesn't need Qhull to be
+run again.  Lists of arrays of different lengths are stored joined together.
+Anything else is pickled.
+"""
+import hashlib
+import logging
+import os
+import pickle
+
+import numpy as np
+from scipy.spatial import Voronoi
+
+# Arguments that change how a drawing is sent to the plotter, or how the
+# program runs, but not what is drawn
+IGNORED_ARGS = ["verbose", "dryrun", "buffered", "encoding", "output",
+                "pipeline", "handshake", "timeout", "metrics", "trace_every",
+                "batch", "count", "workers", "preview_format", "no_cache",
+                "cache_dir", "cache_size", "simplify", "pens"]
+
+# Ending of results still being written, which eviction leaves alone
+TMP_SUFFIX = ".tmp.npz"
+
+VORONOI_ATTRIBUTES = ["points", "vertices", "ridge_points", "ridge_vertices",
+                      "point_region", "regions"]
+
+
+class CachedVoronoi(object):
+    """The arrays of a scipy.spatial.Voronoi, without the Qhull behind it"""
+
+    def __init__(self, **arrays):
+        for name, value in arrays.items():
+            setattr(self, name, value)
+
+
+def _file_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(name, args):
+    """Hash the drawing's name, its arguments and its input files"""
+    h = hashlib.sha256(name.encode("utf-8"))
+    for arg, value in sorted(vars(args).items()):
+        if arg in IGNORED_ARGS:
+            continue
+        h.update("{}={!r};".format(arg, value).encode("utf-8"))
+        if isinstance(value, str) and os.path.isfile(value):
+            h.update(_file_hash(value).encode("ascii"))
+    return h.hexdigest()
+
+
+def _encode(data):
+    """Flatten a dict of results into arrays that np.savez can store"""
+    arrays = {}
+    for key, value in data.items():
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            arrays["array/" + key] = value
+        elif isinstance(value, (Voronoi, CachedVoronoi)):
+            for attr in VORONOI_ATTRIBUTES:
+                part = getattr(value, attr)
+                if attr in ["ridge_vertices", "regions"]:
+                    # Lists of lists, which may be ragged
+                    part = np.frombuffer(pickle.dumps(part), dtype=np.uint8)
+                arrays["voronoi/{}/{}".format(key, attr)] = part
+        elif (isinstance(value, list) and len(value) > 0 and
+              all(isinstance(v, np.ndarray) for v in value)):
+            arrays["ragged/{}/data".format(key)] = np.concatenate(value)
+            arrays["ragged/{}/lengths".format(key)] = np.array(
+                [len(v) for v in value])
+        else:
+            arrays["pickle/" + key] = np.frombuffer(pickle.dumps(value),
+                                                    dtype=np.uint8)
+    return arrays
+
+
+def _decode(arrays):
+    data = {}
+    voronoi = {}
+    for name in arrays.files:
+        kind, rest = name.split("/", 1)
+        value = arrays[name]
+        if kind == "array":
+            data[rest] = value
+        elif kind == "pickle":
+            data[rest] = pickle.loads(value.tobytes())
+        elif kind == "voronoi":
+            key, attr = rest.rsplit("/", 1)
+            if attr in ["ridge_vertices", "regions"]:
+                value = pickle.loads(value.tobytes())
+            voronoi.setdefault(key, {})[attr] = value
+        elif kind == "ragged":
+            key, part = rest.rsplit("/", 1)
+            if part == "data":
+                lengths = arrays["ragged/{}/lengths".format(key)]
+                data[key] = np.split(value, np.cumsum(lengths)[:-1])
+    for key, attrs in voronoi.items():
+        data[key] = CachedVoronoi(**attrs)
+    return data
+
+
+class DrawingCache(object):
+
+    def __init__(self, directory, max_bytes=2 * 1024**3):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def load(self, key):
+        """Return the results stored under key, or None"""
+        path = self._path(key)
+        try:
+            with np.load(path) as arrays:
+                data = _decode(arrays)
+        except FileNotFoundError:
+            # Never stored, or evicted by another process
+            return None
+        except (IOError, ValueError, pickle.UnpicklingError) as e:
+            logging.warning("Ignoring unreadable cache file {}: {}".format(
+                path, e))
+            return None
+
+        # Mark it as recently used, unless it's been evicted since
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            pass
+        logging.info("Loaded results from cache {}".format(path))
+        return data
+
+    def store(self, key, data):
+        path = self._path(key)
+        # Write then rename, so a half written file is never loaded.  Batch
+        # workers share the cache, so each writes to its own temporary file.
+        tmp = "{}.{}{}".format(path[:-len(".npz")], os.getpid(), TMP_SUFFIX)
+        np.savez_compressed(tmp, **_encode(data))
+        os.replace(tmp, path)
+        logging.debug("Saved results to cache {}".format(path))
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """Delete the least recently used results, other than `keep`, until
+        the cache fits in max_bytes.  Other processes may be adding to and
+        evicting from the cache at the same time, so files can disappear
+        from under us at any point."""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if (not name.endswith(".npz") or name.endswith(TMP_SUFFIX) or
+                    path == keep):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if keep is not None:
+            try:
+                total += os.path.getsize(keep)
+            except FileNotFoundError:
+                pass
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            logging.debug("Evicting {} from cache".format(path))
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
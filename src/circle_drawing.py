@@ -2,15 +2,15 @@ import argparse
 import logging
 import random
 
-import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
-from PIL import Image
 import scipy.interpolate
 
 from base_drawing import BaseDrawing
+import image_ingest
 from plotter import Plotter
-import util
+import preview
+import transform
 
 IMG_SCALE = 8
 
@@ -22,17 +22,28 @@ class CircleDrawing(BaseDrawing):
         self.parser.add_argument("--revolutions", type=int, default=30)
         self.parser.add_argument("--max-deviation", type=float, default=3)
         self.parser.add_argument("--scale-factor", type=float, default=0.5)
+        self.add_color_arguments()
 
 
     def perform_computations(self):
 
-        n = 1
+        source = image_ingest.ImageSource(self.args.image_file, rotate=180,
+                                          expand=False)
+
+        if source.is_color and self.args.cmyk is True:
+            return self.compute_layers(
+                [source.with_separation(separation)
+                 for separation in image_ingest.SEPARATIONS])
+
+        return self.compute_layer(source)
 
-        image=np.asarray(Image.open(
-            self.args.image_file).rotate(180)).astype('float')
 
-        if len(image.shape) > 2:
-            image = util.rgb2gray(image)
+    def compute_layer(self, source):
+        """Wobble a spiral more where a greyscale image is darker"""
+
+        n = 1
+
+        image = source.read()
 
         image[image > 200] = 255
 
@@ -67,35 +78,27 @@ class CircleDrawing(BaseDrawing):
 
 
     def display_image(self):
-        plt.plot(self.data["x"], self.data["y"], 'k', linewidth=1)
-        plt.show(block=False)
+        layers = self.layers()
+        preview.show_layers(
+            [np.column_stack([data["x"], data["y"]]) for _, data, _ in layers],
+            [color for _, _, color in layers], linewidth=1)
 
 
     def plot_image(self):
 
-        xxc = self.data["x"]
-        yyc = self.data["y"]
-        r = self.data["r"]
-
-        mx = (p.xmin + p.xmax) / 2.
-        my = (p.ymin + p.ymax) / 2.
-        maxradius = min([p.ymax, p.xmax]) / 2.0
-
-        for i, _ in enumerate(xxc):
-            if i == 0:
-                continue
-
-            start = np.array([r[i-1] * xxc[i-1],
-                             r[i-1] * yyc[i-1]]) * maxradius
-            end = np.array([r[i] * xxc[i],
-                             r[i] * yyc[i]]) * maxradius
+        mx = (self.p.xmin + self.p.xmax) / 2.
+        my = (self.p.ymin + self.p.ymax) / 2.
+        maxradius = min([self.p.ymax, self.p.xmax]) / 2.0
+        self.p.set_transform(transform.Transform(scale=maxradius,
+                                                 offset=(mx, my)))
 
-            start[0] += mx
-            start[1] += my
+        for pen, data, _ in self.layers():
+            xxc = data["x"]
+            yyc = data["y"]
+            r = data["r"]
 
-            end[0] += mx
-            end[1] += my
-            self.p.write_segment(np.array([start, end]))
+            self.p.select_pen(pen)
+            self.p.write_polyline(np.column_stack([r * xxc, r * yyc]))
 
 
 if __name__ == "__main__":
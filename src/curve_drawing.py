@@ -3,17 +3,24 @@ import copy
 import logging
 import random
 
-import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
-from PIL import Image
 import scipy.interpolate
+from scipy.spatial import cKDTree
 
 from base_drawing import BaseDrawing
-from plotter import Plotter
-import util
+import image_ingest
+from plotter import (DEFAULT_MARGIN, DEFAULT_PAPER_SIZE, PAPER_SIZES,
+                     Plotter)
+import preview
+import sampling
+import spline_sampling
+import transform
 
 
+# Fewest points a closed cubic spline can be fitted through
+MIN_POINTS = 4
+
 class CurveDrawing(BaseDrawing):
 
     def get_command_line_args(self):
@@ -25,119 +32,156 @@ class CurveDrawing(BaseDrawing):
         self.parser.add_argument("--ceil", type=float, default=255)
         self.parser.add_argument("--choice-scatter", type=int, default=50)
         self.parser.add_argument("--jump-probability", type=float, default=0.005)
+        self.parser.add_argument("--chord-tolerance", dest="chord_tolerance",
+                                 type=float, default=10.0,
+                                 help="Place points along the curve so it "
+                                 "strays no more than this many plotter "
+                                 "units from the true spline, more closely "
+                                 "on tight bends.  0 places ten per point, "
+                                 "evenly")
+        self.parser.add_argument("--exact-count", dest="exact_count",
+                                 action="store_true")
+        self.parser.set_defaults(exact_count=False)
+        self.add_color_arguments()
 
     def perform_computations(self):
 
-        img=np.asarray(Image.open(
-            self.args.image_file).rotate(
-                self.args.rotate, expand=True)).astype('float')
+        source = image_ingest.ImageSource(self.args.image_file,
+                                          rotate=self.args.rotate)
         logging.info("Loaded image {}".format(self.args.image_file))
-        logging.info("Image has size {}x{}".format(img.shape[0], img.shape[1]))
-
-        # Greyscale images are 2d arrays, color ones are 3d (x, y)
-        if len(img.shape) > 2:
+        logging.info("Image has size {}x{}".format(source.shape[0],
+                                                   source.shape[1]))
+
+        if source.is_color:
+            if self.args.cmyk is True:
+                logging.info("Image is in color, splitting it into CMYK")
+                return self.compute_layers(
+                    [source.with_separation(separation)
+                     for separation in image_ingest.SEPARATIONS])
             logging.info("Image is in color, changing to greyscale")
-            img = util.rgb2gray(img)
 
-        img = (255 - img)
-        img[img < self.args.floor] = self.args.floor
-        img[img > self.args.ceil] = self.args.ceil
-        img = img ** self.args.power
+        return self.compute_layer(source)
 
-        # Convert each point to the probability of containing a point
-        img = self.args.points * img / np.sum(img)
+    def compute_layer(self, source):
+        """Place points on a greyscale image and draw a closed curve through
+        them.  Returns None if there's too little ink to place any."""
 
-        actual_points = 0
-        points = []
-        for ii in range(img.shape[0]):
-            for jj in range(img.shape[1]):
-                if img[ii][jj] > random.random():
-                    actual_points += 1
-                    points.append((ii,jj))
+        points = sampling.sample_tiled(
+            lambda: source.darkness_tiles(self.args.floor, self.args.ceil,
+                                          self.args.power),
+            self.args.points, exact=self.args.exact_count,
+            seed=self.args.seed)
+        if len(points) < MIN_POINTS:
+            # A separation with next to no ink in it
+            logging.info("Only {} points, leaving this layer out".format(
+                len(points)))
+            return None
 
         pc = copy.copy(points)
-        logging.info("Points requested: {}".format(self.args.points))
-        logging.info("Actual points generated: {}".format(actual_points))
 
         points = self._sort_points(points)
-        points = np.array(points)
 
-        tck, u = scipy.interpolate.splprep(points.T, u=None, s=0.0, per=1)
-        u_new = np.linspace(u.min(), u.max(), len(points)*10)
-        x_new, y_new = scipy.interpolate.splev(u_new, tck, der=0)
+        if self.args.chord_tolerance > 0:
+            curve = spline_sampling.sample_closed_curve(
+                points, self.args.chord_tolerance / self._plotter_scale(points))
+            x_new, y_new = curve.T
+            logging.info("Sampled curve at {} points".format(len(curve)))
+        else:
+            tck, u = scipy.interpolate.splprep(points.T, u=None, s=0.0,
+                                               per=1)
+            u_new = np.linspace(u.min(), u.max(), len(points)*10)
+            x_new, y_new = scipy.interpolate.splev(u_new, tck, der=0)
 
         return {"points": pc, "x": x_new, "y": y_new}
 
 
-    def _sort_points(self, points):
-
-        sorted_points = []
-        np.random.shuffle(points)
+    def _plotter_scale(self, points):
+        """Roughly how many plotter units one pixel will come out as, once
+        plot_image fits the curve to the page"""
+        xmax, ymax = PAPER_SIZES[DEFAULT_PAPER_SIZE]
+        bounds = list(zip(points.min(axis=0), points.max(axis=0)))
+        fitted = transform.fit(bounds, ((0, xmax), (0, ymax)),
+                               margin=DEFAULT_MARGIN)
+        return fitted.matrix[0, 0]
 
-        first, rest = points[0], points[1:]
-        points = rest
-        sorted_points.append(first)
 
-        while len(points) > 0:
-            xc = sorted_points[-1][0]
-            yc = sorted_points[-1][1]
+    def _sort_points(self, points):
+        """Order the points into a path.  From each point, usually step to one
+        picked at random from the `choice_scatter` nearest points not yet
+        visited, but occasionally jump to a random point anywhere.
+        """
+        points = np.asarray(points)
+        n = len(points)
+        if n == 0:
+            return points
+
+        visited = np.zeros(n, dtype=bool)
+        order = np.empty(n, dtype=int)
+
+        # Points still to visit, and a KD-tree over them.  Both are rebuilt
+        # once half of them have been visited, so queries stay quick.
+        remaining = np.arange(n)
+        tree = cKDTree(points)
+        visited_since_build = 0
+
+        current = np.random.randint(n)
+        for step in range(n):
+            visited[current] = True
+            visited_since_build += 1
+            order[step] = current
+            if step == n - 1:
+                break
+
+            if visited_since_build * 2 > len(remaining):
+                remaining = remaining[~visited[remaining]]
+                tree = cKDTree(points[remaining])
+                visited_since_build = 0
 
             if random.random() < self.args.jump_probability:
-                np.random.shuffle(points)
-                first, rest = points[0], points[1:]
-                points = rest
-            else:
-                points.sort(key=lambda x: (x[0]-xc)**2 + (x[1]-yc)**2)
-                max_pick = min([len(points), self.args.choice_scatter])
-                if len(points) < self.args.choice_scatter:
-                    break
-                selected_point = random.randint(0, max_pick-1)
-                first = points[selected_point]
-                del(points[selected_point])
+                while True:
+                    current = remaining[np.random.randint(len(remaining))]
+                    if not visited[current]:
+                        break
+                continue
 
+            # Ask for more neighbours until enough unvisited ones turn up
+            left = n - step - 1
+            scatter = min(self.args.choice_scatter, left)
+            k = scatter
+            while True:
+                k = min(2 * k, len(remaining))
+                _, idx = tree.query(points[current], k=k)
+                nearest = remaining[np.atleast_1d(idx)]
+                nearest = nearest[~visited[nearest]]
+                if len(nearest) >= scatter or k == len(remaining):
+                    break
 
-            sorted_points.append(first)
+            current = nearest[random.randint(0, scatter-1)]
 
-        return sorted_points
+        return points[order]
 
 
     def display_image(self):
 
-        points = self.data["points"]
-        x = self.data["x"]
-        y = self.data["y"]
-
-        px = [x[0] for x in points]
-        py = [x[1] for x in points]
-
-        plt.plot(x, y, 'k', linewidth=1)
-        plt.show(block=False)
+        layers = self.layers()
+        preview.show_layers(
+            [np.column_stack([data["x"], data["y"]]) for _, data, _ in layers],
+            [color for _, _, color in layers], linewidth=1)
 
 
 
     def plot_image(self):
 
-        x = self.data["x"]
-        y = self.data["y"]
+        layers = self.layers()
+        x = np.concatenate([data["x"] for _, data, _ in layers])
+        y = np.concatenate([data["y"] for _, data, _ in layers])
 
-        xmin = min(x)
-        xmax = max(x)
-        ymin = min(y)
-        ymax = max(y)
-
-        # n.b. there is probably a fix to do here to get things to scale to
-        # the full size of the page.
-        divisor = max([(xmax-xmin), (ymax-ymin)])
-        x = self.p.ymax * (x - xmin) / divisor
-        y = self.p.ymax * (y - ymin) / divisor
-
-        for i, _ in enumerate(x):
-            if i == 0:
-                continue
+        # Every layer is placed the same, so that they line up
+        self.p.fit_page(((x.min(), x.max()), (y.min(), y.max())))
 
-            start = np.array([x[i-1], y[i-1]])
-            end = np.array([x[i], y[i]])
-            self.p.write_segment(np.array([start, end]))
+        for pen, data, _ in layers:
+            self.p.select_pen(pen)
+            self.p.write_polyline(np.column_stack([data["x"], data["y"]]))
 
 
 if __name__ == "__main__":
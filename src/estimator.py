@@ -0,0 +1,154 @@
+"""Predict how long the plotter will take to draw something.
+
+PlotTimeEstimator stands in for the output file of a Plotter, so a drawing
+can run its plot_image() into it and get an estimate back without anything
+being sent anywhere.  The estimate adds up the time to move the pen, with and
+without it touching the paper, the time spent lifting and lowering it, and
+the time taken to get each command down the serial line.
+"""
+import numpy as np
+
+import hpgl_pe
+from simulated_plotter import (BITS_PER_BYTE, COMMAND_TIME, PEN_LIFT_TIME,
+                               PEN_SPEED)
+
+# How quickly the pen gets up to speed, about 4g, in plotter units (40 to the
+# mm) per second squared
+PEN_ACCELERATION = 4 * 9810 * 40.0
+
+# Seconds to put one pen back in the carousel and pick up another
+PEN_CHANGE_TIME = 6.0
+
+# Bytes for the OS; query and its reply, which unbuffered sends add to every
+# command
+STATUS_ROUND_TRIP = 8
+
+
+class PlotTimeEstimator(object):
+
+    def __init__(self, baudrate=9600, buffered=False, pen_speed=PEN_SPEED,
+                 acceleration=PEN_ACCELERATION, pen_lift_time=PEN_LIFT_TIME,
+                 command_time=COMMAND_TIME, pen_change_time=PEN_CHANGE_TIME):
+        self.name = "plot time estimator"
+        self.baudrate = baudrate
+        self.buffered = buffered
+        self.pen_speed = pen_speed
+        self.acceleration = acceleration
+        self.pen_lift_time = pen_lift_time
+        self.command_time = command_time
+        self.pen_change_time = pen_change_time
+
+        self.partial = b""
+        self.commands = 0
+        self.bytes = 0
+        self.pen_lifts = 0
+        self.pen_down = False
+        self.pen = 0
+        self.pen_changes = 0
+
+        # Every place the pen moves to, and whether it's down on the way there
+        self.points = [(0, 0)]
+        self.down = [False]
+
+    def write(self, data):
+        """Takes HPGL exactly as Plotter would send it to the plotter"""
+        data = bytes(data)
+        self.bytes += len(data)
+        commands = (self.partial + data).replace(b"\r", b"").split(b";")
+        self.partial = commands.pop()
+        for command in commands:
+            self._command(command.strip())
+        return len(data)
+
+    def close(self):
+        pass
+
+    def _set_pen(self, down):
+        if self.pen_down is True and down is False:
+            self.pen_lifts += 1
+        self.pen_down = down
+
+    def _command(self, command):
+        if len(command) < 2:
+            return
+        self.commands += 1
+        opcode = command[:2].upper()
+
+        if opcode in [b"PU", b"PD", b"PA"]:
+            if opcode != b"PA":
+                self._set_pen(opcode == b"PD")
+            values = [int(float(v)) for v in command[2:].split(b",")
+                      if len(v.strip()) > 0]
+            for x, y in zip(values[0::2], values[1::2]):
+                self.points.append((x, y))
+                self.down.append(self.pen_down)
+        elif opcode == b"PE":
+            points, down = hpgl_pe.decode_pe(command + b";",
+                                             start=self.points[-1])
+            for point, pen_down in zip(points, down):
+                self._set_pen(bool(pen_down))
+                self.points.append(tuple(point))
+                self.down.append(self.pen_down)
+        elif opcode == b"SP":
+            self._set_pen(False)
+            # SP0 only puts the pen away, which isn't a change of pen
+            pen = int(command[2:] or 0)
+            if pen != 0 and pen != self.pen:
+                self.pen_changes += 1
+            self.pen = pen
+
+    def _move_times(self, distances):
+        """Time for moves of the given lengths, speeding up and slowing down
+        at the pen's acceleration and never going faster than its top speed"""
+        v = self.pen_speed
+        a = self.acceleration
+        ramp = v * v / a
+        return np.where(distances > ramp,
+                        distances / v + v / a,
+                        2 * np.sqrt(distances / a))
+
+    def estimate(self):
+        """Return a dict describing where the time goes, in seconds"""
+        points = np.array(self.points, dtype=float)
+        down = np.array(self.down[1:], dtype=bool)
+        distances = np.hypot(*np.diff(points, axis=0).T)
+        times = self._move_times(distances)
+
+        serial_bytes = self.bytes
+        if self.buffered is False:
+            serial_bytes += self.commands * STATUS_ROUND_TRIP
+        serial_time = serial_bytes * BITS_PER_BYTE / float(self.baudrate)
+
+        motion_time = (np.sum(times) + 2 * self.pen_lifts * self.pen_lift_time
+                       + self.commands * self.command_time
+                       + self.pen_changes * self.pen_change_time)
+
+        # Buffered, the plotter draws while the next commands arrive.
+        # Otherwise every command waits for the one before to finish.
+        if self.buffered is True:
+            total = max(serial_time, motion_time)
+        else:
+            total = serial_time + motion_time
+
+        return {
+            "total": total,
+            "serial": serial_time,
+            "motion": motion_time,
+            "pen_down_distance": np.sum(distances[down]),
+            "pen_up_distance": np.sum(distances[~down]),
+            "pen_lifts": self.pen_lifts,
+            "pen_changes": self.pen_changes,
+            "commands": self.commands,
+            "bytes": serial_bytes,
+        }
+
+    def summary(self):
+        e = self.estimate()
+        minutes, seconds = divmod(int(e["total"]), 60)
+        hours, minutes = divmod(minutes, 60)
+        return ("{}h{:02d}m{:02d}s ({} commands, {} bytes, {} pen lifts, "
+                "{} pen changes, {:.0f} units drawn, {:.0f} units "
+                "travelled)".format(
+                    hours, minutes, seconds, e["commands"], e["bytes"],
+                    e["pen_lifts"], e["pen_changes"], e["pen_down_distance"],
+                    e["pen_up_distance"]))
@@ -0,0 +1,44 @@
+"""Operations on whole arrays of line segments at once.  Segments are stored
+as an (n, 2, 2) array, where segments[i] is [[x0, y0], [x1, y1]]."""
+import numpy as np
+
+
+def clip_segments(segments, xmin, ymin, xmax, ymax, return_index=False):
+    """Clip every segment to the rectangle [xmin, xmax] x [ymin, ymax] using
+    the Liang-Barsky algorithm.  Segments entirely outside the rectangle, or
+    which are clipped down to nothing, are dropped.
+
+    Returns a new (m, 2, 2) float array with m <= n.  If return_index is set,
+    the indices of the segments that were kept are returned as well.
+    """
+    segments = np.asarray(segments, dtype=float).reshape(-1, 2, 2)
+    x0 = segments[:, 0, 0]
+    y0 = segments[:, 0, 1]
+    dx = segments[:, 1, 0] - x0
+    dy = segments[:, 1, 1] - y0
+
+    t0 = np.zeros(len(segments))
+    t1 = np.ones(len(segments))
+    keep = np.ones(len(segments), dtype=bool)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for p, q in [(-dx, x0 - xmin), (dx, xmax - x0),
+                     (-dy, y0 - ymin), (dy, ymax - y0)]:
+            # Parallel to this edge and outside it
+            keep &= ~((p == 0) & (q < 0))
+            r = q / p
+            t0 = np.where(p < 0, np.maximum(t0, r), t0)
+            t1 = np.where(p > 0, np.minimum(t1, r), t1)
+
+    keep &= t0 < t1
+    start = np.column_stack([x0 + t0 * dx, y0 + t0 * dy])[keep]
+    end = np.column_stack([x0 + t1 * dx, y0 + t1 * dy])[keep]
+
+    # Rounding can leave points a hair outside the rectangle
+    clipped = np.stack([start, end], axis=1)
+    clipped[..., 0] = np.clip(clipped[..., 0], xmin, xmax)
+    clipped[..., 1] = np.clip(clipped[..., 1], ymin, ymax)
+    nonzero = np.any(clipped[:, 0] != clipped[:, 1], axis=1)
+    if return_index is True:
+        return clipped[nonzero], np.flatnonzero(keep)[nonzero]
+    return clipped[nonzero]
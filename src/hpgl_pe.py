@@ -0,0 +1,150 @@
+"""Encoder and decoder for the HP-GL/2 PE (polyline encoded) command.
+
+PE packs a run of coordinates into a handful of bytes each.  After the first
+point every coordinate is relative to the one before, and each number is
+written as a string of base 32 (or base 64) digits, least significant first,
+with the last digit of a number taken from a different range of characters so
+that no separators are needed.  Plotters without HP-GL/2, such as the HP7475A,
+don't understand it.
+"""
+import numpy as np
+
+# Flags that can appear inside a PE command
+FLAG_SEVEN_BIT = b"7"
+FLAG_PEN_UP = b"<"
+FLAG_ABSOLUTE = b"="
+FLAG_FRACTION = b">"
+FLAG_SELECT_PEN = b":"
+
+# Digits are offset by these amounts to make characters.  Which range a
+# character is in tells you whether more digits of the number follow.
+DIGIT_OFFSET = 63
+TERMINATOR_OFFSET = {True: 95, False: 191}
+
+
+def _zigzag(values):
+    """PE keeps the sign in the least significant bit"""
+    values = np.asarray(values, dtype=np.int64)
+    return np.where(values < 0, -2 * values + 1, 2 * values)
+
+
+def _unzigzag(value):
+    if value & 1:
+        return -(value >> 1)
+    return value >> 1
+
+
+def _encode_number(value, seven_bit):
+    bits = 5 if seven_bit is True else 6
+    mask = (1 << bits) - 1
+
+    out = bytearray()
+    while value > mask:
+        out.append((value & mask) + DIGIT_OFFSET)
+        value >>= bits
+    out.append(value + TERMINATOR_OFFSET[seven_bit])
+    return out
+
+
+def encode_pe(points, seven_bit=True):
+    """Turn an (n, 2) array of integer plotter coordinates into a single PE
+    command.  The pen is lifted and moved to the first point in absolute
+    coordinates, then lowered and moved through the rest.
+
+    Seven bit mode (base 32) keeps every byte printable, which is what you
+    want through a serial line or GPIB controller that may mangle the eighth
+    bit.  Otherwise base 64 is used, which is a little more compact.
+    """
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+
+    out = bytearray(b"PE")
+    if len(points) == 0:
+        out += b";"
+        return bytes(out)
+
+    if seven_bit is True:
+        out += FLAG_SEVEN_BIT
+
+    out += FLAG_PEN_UP + FLAG_ABSOLUTE
+    for value in _zigzag(points[0]):
+        out += _encode_number(int(value), seven_bit)
+
+    deltas = _zigzag(np.diff(points, axis=0)).ravel()
+    for value in deltas:
+        out += _encode_number(int(value), seven_bit)
+
+    out += b";"
+    return bytes(out)
+
+
+def decode_pe(data, start=(0, 0)):
+    """Decode a PE command back into coordinates, as a check on encode_pe.
+
+    Returns an (n, 2) integer array of absolute points and a boolean array
+    that is True where the pen was down on the way to that point.  `start` is
+    where the pen was before the command, which relative moves build on.
+    """
+    data = bytes(data)
+    if not data.startswith(b"PE"):
+        raise ValueError("Not a PE command: {!r}".format(data[:10]))
+    body = data[2:]
+    if body.endswith(b";"):
+        body = body[:-1]
+
+    seven_bit = False
+    pen_up = False
+    absolute = False
+    numbers = []
+    current = 0
+    shift = 0
+
+    x, y = start
+    points = []
+    pen_down = []
+
+    for i, char in enumerate(body):
+        flag = body[i:i+1]
+        if shift == 0 and len(numbers) == 0 and flag in (
+                FLAG_SEVEN_BIT, FLAG_PEN_UP, FLAG_ABSOLUTE):
+            if flag == FLAG_SEVEN_BIT:
+                if i != 0:
+                    raise ValueError("7 flag must come first in PE")
+                seven_bit = True
+            elif flag == FLAG_PEN_UP:
+                pen_up = True
+            else:
+                absolute = True
+            continue
+        if shift == 0 and flag in (FLAG_FRACTION, FLAG_SELECT_PEN):
+            raise ValueError("Unsupported PE flag {!r}".format(flag))
+
+        bits = 5 if seven_bit is True else 6
+        terminator = TERMINATOR_OFFSET[seven_bit]
+        if DIGIT_OFFSET <= char < DIGIT_OFFSET + (1 << bits):
+            current |= (char - DIGIT_OFFSET) << shift
+            shift += bits
+            continue
+        if not terminator <= char < terminator + (1 << bits):
+            raise ValueError("Bad byte {} in PE data".format(char))
+
+        current |= (char - terminator) << shift
+        numbers.append(_unzigzag(current))
+        current = 0
+        shift = 0
+
+        if len(numbers) == 2:
+            if absolute is True:
+                x, y = numbers
+            else:
+                x, y = x + numbers[0], y + numbers[1]
+            points.append((x, y))
+            pen_down.append(not pen_up)
+            numbers = []
+            pen_up = False
+            absolute = False
+
+    if shift != 0 or len(numbers) != 0:
+        raise ValueError("PE data ended part way through a coordinate")
+
+    return (np.array(points, dtype=np.int64).reshape(-1, 2),
+            np.array(pen_down, dtype=bool))
@@ -0,0 +1,139 @@
+"""Read images for the drawings a band of rows at a time.
+
+Loading a whole image with np.asarray(...).astype('float') makes a float64
+copy of every channel of every pixel, and turning it into greyscale and
+raising it to a power makes more.  For big scans that runs to gigabytes.
+ImageSource instead keeps the image as PIL decoded it, one byte a channel,
+and hands it out in tiles of whole rows converted to float32.  Each tile is
+made into a darkness map in place, and sampling.sample_tiled() scatters
+points over the tiles one at a time, so the float arrays never get bigger
+than a tile however large the image is.
+"""
+import copy
+import math
+
+import numpy as np
+from PIL import Image
+
+import util
+
+# Roughly how many pixels to convert to floats at once
+TILE_PIXELS = 1 << 22
+
+# Which of the arrays util.rgb2cmyk returns each channel is
+SEPARATIONS = ["cyan", "magenta", "yellow", "black"]
+
+
+def _rotated_size(size, angle):
+    """The size Image.rotate(angle, expand=True) gives an image of `size`,
+    worked out the way PIL does it but without touching any pixels"""
+    w, h = size
+    angle = angle % 360.0
+    if angle in (0, 180):
+        return w, h
+    if angle in (90, 270):
+        return h, w
+
+    # PIL rotates about the centre of the image, with its matrix entries
+    # rounded, and rounds the corners outwards
+    angle = -math.radians(angle)
+    a, b = round(math.cos(angle), 15), round(math.sin(angle), 15)
+    d, e = -b, a
+    c = a * -w / 2.0 + b * -h / 2.0 + w / 2.0
+    f = d * -w / 2.0 + e * -h / 2.0 + h / 2.0
+    corners = [(0, 0), (w, 0), (w, h), (0, h)]
+    xx = [a * x + b * y + c for x, y in corners]
+    yy = [d * x + e * y + f for x, y in corners]
+    return (int(math.ceil(max(xx)) - math.floor(min(xx))),
+            int(math.ceil(max(yy)) - math.floor(min(yy))))
+
+
+class ImageSource(object):
+    """A greyscale view of an image file, or of one of its CMYK separations
+
+    The file is opened lazily, so an ImageSource can be sent to another
+    process cheaply and read there.
+    """
+
+    def __init__(self, filename, rotate=0, expand=True, separation=None,
+                 tile_pixels=TILE_PIXELS):
+        if separation is not None and separation not in SEPARATIONS:
+            raise ValueError("Invalid separation selected")
+        self.filename = filename
+        self.rotate = rotate
+        self.expand = expand
+        self.separation = separation
+        self.tile_pixels = tile_pixels
+        self._image = None
+
+        # Read the size without decoding any pixels
+        with Image.open(filename) as image:
+            size = image.size
+            self.is_color = image.mode not in ["1", "L", "I", "F", "LA",
+                                               "I;16"]
+        if rotate and expand:
+            size = _rotated_size(size, rotate)
+        width, height = size
+        self.shape = (height, width)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_image"] = None
+        return state
+
+    def with_separation(self, separation):
+        """The same image, but one of its CMYK separations.  The file isn't
+        read again, and the image is shared if it's already open."""
+        if separation not in SEPARATIONS:
+            raise ValueError("Invalid separation selected")
+        source = copy.copy(self)
+        source.separation = separation
+        return source
+
+    def _open(self):
+        if self._image is None:
+            image = Image.open(self.filename)
+            if self.rotate:
+                image = image.rotate(self.rotate, expand=self.expand)
+            if image.mode not in ["L", "RGB", "RGBA"]:
+                image = image.convert("RGB" if self.is_color else "L")
+            self._image = image
+        return self._image
+
+    def tiles(self):
+        """Yield (first row, tile) for bands of rows covering the image.  Each
+        tile is a float32 greyscale array, 0 black to 255 white."""
+        image = self._open()
+        height, width = self.shape
+        rows = max(1, self.tile_pixels // max(width, 1))
+        for top in range(0, height, rows):
+            bottom = min(top + rows, height)
+            tile = np.asarray(image.crop((0, top, width, bottom)),
+                              dtype=np.float32)
+            if tile.ndim > 2:
+                if self.separation is not None:
+                    tile = util.rgb2cmyk(tile)[
+                        SEPARATIONS.index(self.separation)]
+                else:
+                    tile = util.rgb2gray(tile)
+                tile = tile.astype(np.float32, copy=False)
+            yield top, tile
+
+    def darkness_tiles(self, floor=0, ceil=255, power=1.0):
+        """Like tiles(), but dark pixels are high, values are clamped to
+        [floor, ceil], and then raised to `power`.  All of it is done in place
+        on each tile."""
+        for top, tile in self.tiles():
+            np.subtract(255, tile, out=tile)
+            np.clip(tile, floor, ceil, out=tile)
+            if power != 1:
+                np.power(tile, power, out=tile)
+            yield top, tile
+
+    def read(self):
+        """The whole greyscale image as one float32 array, for drawings that
+        need to look anywhere in it at once"""
+        out = np.empty(self.shape, dtype=np.float32)
+        for top, tile in self.tiles():
+            out[top:top + len(tile)] = tile
+        return out
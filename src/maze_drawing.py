@@ -4,7 +4,6 @@ import logging
 import random
 import sys
 
-import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
 from PIL import Image
@@ -12,6 +11,8 @@ import scipy.interpolate
 
 from base_drawing import BaseDrawing
 from plotter import Plotter
+import preview
+import transform
 import util
 
 sys.setrecursionlimit(15000)
@@ -75,7 +76,6 @@ class MazeDrawing(BaseDrawing):
                     if ry % 2 == 0:
                         xs = list(reversed(xs))
                     ys = [ry*scale, ry*scale]
-                    plt.plot(xs, ys, "k")
                     the_row.append(np.array([
                         [xs[0], ys[0]], [xs[1], ys[1]]]))
                 rx += s
@@ -108,11 +108,7 @@ class MazeDrawing(BaseDrawing):
 
     def display_image(self):
 
-        for segment in self._yield_segments():
-            xs = [segment[0][0], segment[1][0]]
-            ys = [segment[0][1], segment[1][1]]
-            plt.plot(xs, ys, "k")
-        plt.show(block=False)
+        preview.show_lines(np.array(list(self._yield_segments())))
 
 
 
@@ -123,8 +119,8 @@ class MazeDrawing(BaseDrawing):
 
         scale = min([xscale, yscale])
         logging.info("Scaling image by factor {}".format(scale))
-        for segment in self._yield_segments():
-            self.p.write_segment(segment*scale)
+        self.p.set_transform(transform.Transform(scale=scale))
+        self.p.write_segments(np.array(list(self._yield_segments())))
 
 
 
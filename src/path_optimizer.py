@@ -0,0 +1,329 @@
+"""Turn a soup of line segments into an order the plotter can draw quickly.
+
+Most of the time spent plotting a dense drawing goes into moving the pen
+around with it lifted, so the work here is in two stages:
+
+ 1. Join the segments up into as few continuous trails as possible.  Each
+    connected piece of the drawing is made Eulerian by pairing up its odd
+    degree vertices with pretend "pen up" edges, walked as an Euler circuit,
+    then cut back apart at the pretend edges.  The graph is kept as flat
+    integer arrays, so this runs in close to linear time and memory.
+ 2. Choose an order, and a direction, to draw the trails in.  A nearest
+    neighbour walk over a KD-tree of trail ends gives a starting tour, which
+    is then improved with windowed 2-opt.
+"""
+import logging
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def _clean_segments(segments):
+    """Return an (n, 2, 2) array of segments with zero length and repeated
+    segments removed"""
+    segments = np.asarray(segments).reshape(-1, 2, 2)
+    keep = np.any(segments[:, 0] != segments[:, 1], axis=1)
+    segments = segments[keep]
+    if len(segments) == 0:
+        return segments
+
+    # A segment drawn backwards is still the same segment
+    flat = segments.reshape(-1, 4)
+    swap = ((flat[:, 0] > flat[:, 2]) |
+            ((flat[:, 0] == flat[:, 2]) & (flat[:, 1] > flat[:, 3])))
+    flat = np.where(swap[:, None], flat[:, [2, 3, 0, 1]], flat)
+    flat = np.unique(flat, axis=0)
+    return flat.reshape(-1, 2, 2)
+
+
+def _pair_odd_vertices(points):
+    """Greedily pair up points with their nearest unpaired neighbour.  Returns
+    a list of (i, j) index pairs into points."""
+    n = len(points)
+    if n == 0:
+        return []
+
+    tree = cKDTree(points)
+    paired = np.zeros(n, dtype=bool)
+    pairs = []
+    for i in range(n):
+        if paired[i]:
+            continue
+        paired[i] = True
+        k = 8
+        while True:
+            k = min(k, n)
+            _, idx = tree.query(points[i], k=k)
+            idx = np.atleast_1d(idx)
+            free = idx[~paired[idx]]
+            if len(free) > 0 or k == n:
+                break
+            k *= 4
+        if len(free) == 0:
+            break
+        j = free[0]
+        paired[j] = True
+        pairs.append((i, j))
+    return pairs
+
+
+class SegmentGraph(object):
+    """Compact undirected multigraph over integer coordinates.
+
+    Vertices are the distinct points in the segments, numbered by np.unique,
+    and edges are rows of `edges` holding a pair of vertex numbers.  Each
+    vertex's edges are found through CSR style arrays: the edges touching
+    vertex v are adjacency[indptr[v]:indptr[v+1]].
+    """
+
+    def __init__(self, segments):
+        segments = np.asarray(segments).reshape(-1, 2, 2)
+        self.vertices, inverse = np.unique(segments.reshape(-1, 2), axis=0,
+                                           return_inverse=True)
+        self.edges = np.asarray(inverse).reshape(-1, 2)
+        self.real = np.ones(len(self.edges), dtype=bool)
+
+    @property
+    def degree(self):
+        return np.bincount(self.edges.ravel(), minlength=len(self.vertices))
+
+    def add_edges(self, edges, real=False):
+        edges = np.asarray(edges, dtype=self.edges.dtype).reshape(-1, 2)
+        self.edges = np.concatenate([self.edges, edges])
+        self.real = np.concatenate([self.real,
+                                    np.full(len(edges), real, dtype=bool)])
+
+    def build_adjacency(self):
+        """(Re)build indptr and adjacency from the current edge list"""
+        ends = self.edges.ravel()
+        order = np.argsort(ends, kind="mergesort")
+        self.adjacency = order // 2
+        self.indptr = np.zeros(len(self.vertices) + 1, dtype=int)
+        np.cumsum(self.degree, out=self.indptr[1:])
+
+    def eulerian_circuits(self):
+        """Yield an Euler circuit of every connected piece of the graph, as a
+        list of (vertex, edge used to get there) pairs.  The first pair has
+        no edge, and is given -1.  Every vertex must have even degree.
+        """
+        self.build_adjacency()
+        # Plain lists are much quicker than numpy arrays to index one element
+        # at a time, which is all this loop does
+        edges = self.edges.tolist()
+        indptr = self.indptr.tolist()
+        adjacency = self.adjacency.tolist()
+        used = [False] * len(edges)
+        ptr = indptr[:-1]
+
+        for start in range(len(self.vertices)):
+            stack = [(start, -1)]
+            circuit = []
+            # Hierholzer's algorithm, without recursion
+            while len(stack) > 0:
+                v, e_in = stack[-1]
+                p = ptr[v]
+                end = indptr[v+1]
+                while p < end and used[adjacency[p]]:
+                    p += 1
+                if p == end:
+                    ptr[v] = p
+                    stack.pop()
+                    circuit.append((v, e_in))
+                    continue
+                e = adjacency[p]
+                ptr[v] = p + 1
+                used[e] = True
+                w = edges[e][0] if edges[e][1] == v else edges[e][1]
+                stack.append((w, e))
+
+            if len(circuit) > 1:
+                yield circuit[::-1]
+
+
+def find_trails(segments):
+    """Join segments into trails.  Returns a list of (k, 2) arrays of points,
+    with each segment appearing in exactly one of them."""
+    segments = _clean_segments(segments)
+    if len(segments) == 0:
+        return []
+
+    graph = SegmentGraph(segments)
+    odd = np.flatnonzero(graph.degree % 2 == 1)
+    pairs = _pair_odd_vertices(graph.vertices[odd])
+    graph.add_edges(odd[np.array(pairs, dtype=int).reshape(-1, 2)],
+                    real=False)
+
+    trails = []
+    for circuit in graph.eulerian_circuits():
+        start = circuit[0][0]
+        steps = circuit[1:]
+
+        # Start the walk just after a pretend edge, so that cutting at the
+        # pretend edges gives whole trails
+        fake = [i for i, (_, e) in enumerate(steps) if not graph.real[e]]
+        if len(fake) > 0:
+            start = steps[fake[0]][0]
+            steps = steps[fake[0]+1:] + steps[:fake[0]+1]
+
+        trail = [start]
+        for v, e in steps:
+            if not graph.real[e]:
+                if len(trail) > 1:
+                    trails.append(graph.vertices[trail])
+                trail = [v]
+                continue
+            trail.append(v)
+        if len(trail) > 1:
+            trails.append(graph.vertices[trail])
+
+    return trails
+
+
+def _nearest_neighbour_order(starts, ends, origin):
+    """Greedy tour: from the pen's position, repeatedly draw whichever trail
+    has the nearest end, starting from that end.  Returns the order of trails
+    and whether each one is drawn backwards."""
+    n = len(starts)
+    endpoints = np.concatenate([starts, ends])
+    used = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=int)
+    flipped = np.zeros(n, dtype=bool)
+
+    # The tree is rebuilt from whatever is left once half of it has been used,
+    # so queries never have to wade through lots of used trails
+    remaining = np.arange(2 * n)
+    tree = cKDTree(endpoints)
+    used_since_build = 0
+
+    position = np.asarray(origin, dtype=float)
+    for step in range(n):
+        if used_since_build * 2 > len(remaining):
+            remaining = remaining[~used[remaining % n]]
+            tree = cKDTree(endpoints[remaining])
+            used_since_build = 0
+
+        k = 4
+        while True:
+            k = min(k, len(remaining))
+            _, idx = tree.query(position, k=k)
+            candidates = remaining[np.atleast_1d(idx)]
+            free = candidates[~used[candidates % n]]
+            if len(free) > 0:
+                break
+            k *= 4
+
+        choice = free[0]
+        trail = choice % n
+        used[trail] = True
+        used_since_build += 1
+        order[step] = trail
+        flipped[step] = choice >= n
+        position = starts[trail] if flipped[step] else ends[trail]
+
+    return order, flipped
+
+
+def _two_opt(starts, ends, origin, window=50, passes=5):
+    """Improve a tour of trails with 2-opt moves.  starts and ends hold where
+    each trail begins and ends, in drawing order.  Reversing a run of trails
+    also reverses the direction each of them is drawn in.
+
+    Only moves that reverse at most `window` trails are tried.  Returns the
+    new order as indices into the input, and which trails are now reversed.
+    """
+    n = len(starts)
+    starts = starts.astype(float)
+    ends = ends.astype(float)
+    perm = np.arange(n)
+    reversed_ = np.zeros(n, dtype=bool)
+    origin = np.asarray(origin, dtype=float)
+
+    for _ in range(passes):
+        improved = False
+        for i in range(-1, n - 1):
+            a = origin if i < 0 else ends[i]
+            b = starts[i+1]
+            lo = i + 1
+            hi = min(i + 1 + window, n)
+            c = ends[lo:hi]
+            # Where the pen goes after the reversed run.  Past the last trail
+            # it goes nowhere, so d can be one shorter than c.
+            d = starts[lo+1:hi+1]
+
+            gain = (np.hypot(*(a - b)) -
+                    np.hypot(c[:, 0] - a[0], c[:, 1] - a[1]))
+            m = len(d)
+            gain[:m] += (np.hypot(c[:m, 0] - d[:, 0], c[:m, 1] - d[:, 1]) -
+                         np.hypot(b[0] - d[:, 0], b[1] - d[:, 1]))
+            best = np.argmax(gain)
+            if gain[best] <= 1e-9:
+                continue
+
+            block = slice(lo, lo + best + 1)
+            new_starts = ends[block][::-1].copy()
+            new_ends = starts[block][::-1].copy()
+            starts[block] = new_starts
+            ends[block] = new_ends
+            perm[block] = perm[block][::-1].copy()
+            reversed_[block] = ~reversed_[block][::-1]
+            improved = True
+        if not improved:
+            break
+
+    return perm, reversed_
+
+
+def path_lengths(polylines, origin=(0, 0)):
+    """Total distance travelled with the pen down and with the pen up to draw
+    the polylines in the order given, starting from origin"""
+    if len(polylines) == 0:
+        return 0.0, 0.0
+
+    lines = [np.asarray(line, dtype=float) for line in polylines]
+    points = np.concatenate(lines)
+    steps = np.hypot(*np.diff(points, axis=0).T)
+
+    # Steps from the end of one line to the start of the next are pen up
+    line_starts = np.cumsum([len(line) for line in lines])[:-1]
+    jumps = np.zeros(len(steps), dtype=bool)
+    jumps[line_starts - 1] = True
+
+    pen_up = np.hypot(*(points[0] - origin)) + np.sum(steps[jumps])
+    pen_down = np.sum(steps[~jumps])
+    return pen_down, pen_up
+
+def optimize_paths(segments, origin=(0, 0), window=50, passes=5):
+    """Return the segments joined into polylines, ordered and oriented so the
+    plotter spends as little time as it can moving with the pen up"""
+    segments = np.asarray(segments).reshape(-1, 2, 2)
+    down_before, up_before = path_lengths(segments, origin=origin)
+
+    logging.info("[OPTIMIZER] Starting path optimization...")
+    logging.info("\t... Number of segments: {}".format(len(segments)))
+
+    trails = find_trails(segments)
+    logging.info("\t... Number of trails: {}".format(len(trails)))
+    if len(trails) == 0:
+        return []
+
+    starts = np.array([t[0] for t in trails])
+    ends = np.array([t[-1] for t in trails])
+
+    order, flipped = _nearest_neighbour_order(starts, ends, origin)
+    tour_starts = np.where(flipped[:, None], ends[order], starts[order])
+    tour_ends = np.where(flipped[:, None], starts[order], ends[order])
+
+    perm, reversed_ = _two_opt(tour_starts, tour_ends, origin,
+                               window=window, passes=passes)
+    order = order[perm]
+    flipped = flipped[perm] ^ reversed_
+
+    polylines = [trails[t][::-1] if flip else trails[t]
+                 for t, flip in zip(order, flipped)]
+
+    down_after, up_after = path_lengths(polylines, origin=origin)
+    logging.info("\t... Pen down distance: {:.0f} -> {:.0f}".format(
+        down_before, down_after))
+    logging.info("\t... Pen up distance: {:.0f} -> {:.0f}".format(
+        up_before, up_after))
+    return polylines
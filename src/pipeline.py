@@ -0,0 +1,124 @@
+"""Overlap working out what to draw with sending it to the plotter.
+
+PlotPipeline stands in for a Plotter inside plot_image().  Lines handed to it
+are cut into chunks of a few thousand points.  Each chunk is transformed,
+simplified and rounded to plotter units on the drawing's own thread, then put
+on a bounded queue, while a transmitter thread takes chunks off the queue and
+sends them on the real Plotter.  So the pen starts moving as soon as the first
+chunk is ready rather than once the whole drawing is, the next chunk is being
+worked out while the last one goes down the wire, and a drawing that produces
+lines faster than the plotter can take them is held back instead of piling
+them up in memory.
+"""
+import logging
+import queue
+import threading
+
+import numpy as np
+
+import simplify
+
+# Plotter methods that send commands, and so are queued for the transmitter.
+# Everything else, like xmax or set_transform(), goes straight to the plotter:
+# lines are put on the page before they're queued, so changes to how that's
+# done have to happen straight away.
+QUEUED_METHODS = ["write_circle", "write_square", "write_hpgl", "select_pen"]
+
+# Roughly how many points go in each chunk.  Long lines are cut every this
+# many points, which is a multiple of simplify.MAX_RUN so that the pieces are
+# simplified just as the whole line would be.
+CHUNK_POINTS = 8 * simplify.MAX_RUN
+
+# Marks the end of the queue
+_DONE = object()
+
+
+def chunk_polylines(lines, chunk_points=CHUNK_POINTS):
+    """Yield lists of polylines with about chunk_points points between them.
+    Lines longer than that are cut into pieces, each starting where the last
+    one ended, so they're still drawn as one line."""
+    chunk = []
+    size = 0
+    for line in lines:
+        line = np.reshape(line, (-1, 2))
+        for start in range(0, max(len(line) - 1, 1), chunk_points):
+            piece = line[start:start + chunk_points + 1]
+            chunk.append(piece)
+            size += len(piece)
+            if size >= chunk_points:
+                yield chunk
+                chunk = []
+                size = 0
+    if len(chunk) > 0:
+        yield chunk
+
+
+class PlotPipeline(object):
+
+    def __init__(self, plotter, maxsize=16, chunk_points=CHUNK_POINTS):
+        self.plotter = plotter
+        self.chunk_points = chunk_points
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self._transmit,
+                                       name="plot-transmitter")
+        self.thread.daemon = True
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.queue.put(_DONE)
+        self.thread.join()
+        if exc_type is None:
+            self._check_error()
+
+    def __getattr__(self, name):
+        if name in QUEUED_METHODS:
+            def queued(*args, **kwargs):
+                self._put(name, *args, **kwargs)
+            return queued
+        return getattr(self.plotter, name)
+
+    def write_segment(self, segment):
+        self.write_segments([segment])
+
+    def write_segments(self, segments):
+        segments = np.reshape(segments, (-1, 2, 2))
+        step = max(self.chunk_points // 2, 1)
+        for start in range(0, len(segments), step):
+            self._put("write_quantized", self.plotter.quantize_segments(
+                segments[start:start + step]))
+
+    def write_polyline(self, points):
+        self.write_polylines([points])
+
+    def write_polylines(self, lines):
+        for chunk in chunk_polylines(lines, self.chunk_points):
+            self._put("write_quantized",
+                      self.plotter.quantize_polylines(chunk))
+
+    def _put(self, name, *args, **kwargs):
+        self._check_error()
+        self.queue.put((name, args, kwargs))
+
+    def _check_error(self):
+        if self.error is not None:
+            raise RuntimeError("Sending to the plotter failed") from self.error
+
+    def _transmit(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            if self.error is not None:
+                # Keep emptying the queue so the drawing isn't left blocked
+                continue
+
+            name, args, kwargs = item
+            try:
+                getattr(self.plotter, name)(*args, **kwargs)
+            except Exception as e:
+                logging.error("Transmitter stopped: {}".format(e))
+                self.error = e
@@ -0,0 +1,82 @@
+"""Send a file of HPGL saved with --output to the plotter.  The file is read a
+chunk at a time, so it can be as big as you like, and goes through the same
+flow control as a drawing sent directly.
+
+The Plotter starts and finishes the drawing itself, so the set up commands at
+the start of the file are skipped, and pen changes go through select_pen(),
+which leaves out the ones that select the pen already in hand.  That way the
+SP1 at the start and the SP0 at the end aren't sent twice, but the pen
+changes between layers are kept."""
+import argparse
+import logging
+import time
+
+from plotter import Plotter
+import util
+
+# Commands the Plotter sends itself when it starts
+SETUP_COMMANDS = [b"IN;", b"OI;", b"OF;"]
+
+
+def read_lines(f, chunk_size=65536):
+    """Yield the lines of a file of HPGL one at a time.  Plotter output ends
+    lines with a carriage return, but newlines are accepted too."""
+    leftover = b""
+    while True:
+        chunk = f.read(chunk_size)
+        if len(chunk) == 0:
+            break
+        lines = (leftover + chunk).replace(b"\n", b"\r").split(b"\r")
+        leftover = lines.pop()
+        for line in lines:
+            if len(line) > 0:
+                yield line
+    if len(leftover) > 0:
+        yield leftover
+
+
+def play(plotter, lines):
+    """Send lines of HPGL from a file made by a Plotter to another one"""
+    started = False
+    for line in lines:
+        if started is False and line in SETUP_COMMANDS:
+            continue
+        started = True
+        if line.startswith(b"SP") and line.endswith(b";"):
+            plotter.select_pen(int(line[2:-1] or 0))
+        else:
+            plotter.write_hpgl(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", type=str,
+                        help="File of HPGL commands to send to the plotter")
+    parser.add_argument('--verbose', dest='verbose', action='store_true')
+    parser.set_defaults(verbose=False)
+    parser.add_argument('--dry-run', dest='dryrun', action='store_true')
+    parser.set_defaults(dryrun=False)
+    parser.add_argument('--buffered', dest='buffered', action='store_true',
+                        help="Send commands to the plotter in batches "
+                        "instead of one at a time")
+    parser.set_defaults(buffered=False)
+    parser.add_argument('--device', type=str, default="/dev/ttyUSB0")
+    parser.add_argument('--handshake', choices=["none", "xonxoff", "rtscts"],
+                        default="none")
+    parser.add_argument('--timeout', type=float, default=5.0)
+    args = parser.parse_args()
+
+    util.init_logger(verbose=args.verbose)
+
+    start = time.time()
+    with Plotter(verbose=args.verbose, dryrun=args.dryrun,
+                 buffered=args.buffered, device=args.device,
+                 handshake=args.handshake, timeout=args.timeout) as p:
+        with open(args.filename, "rb") as f:
+            play(p, read_lines(f))
+    end = time.time()
+    logging.info("Drawing took {}s".format((end-start)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,150 @@
 """Class abstracts the pen plotter.  Handles startup and shutdown boilerplate,
 and takes care of sending to the serial port."""
 import logging
+import math
 import time
-import serial
+
+import hpgl_pe
+from plotter_link import HANDSHAKES, PlotterLink, open_port
+from plotter_metrics import PlotterMetrics
+from simulated_plotter import PEN_LIFT_TIME, PEN_SPEED
+import transform
+
+# Size of the HP7475A's input buffer in bytes, used when it can't be queried
+DEFAULT_BUFFER_SIZE = 1024
+
+# Most points packed into a single PD command when joining up segments.  This
+# keeps every command comfortably smaller than a batch of buffered output.
+MAX_POLYLINE_POINTS = 32
+
+# PE commands are more compact, so can carry more points each
+MAX_PE_POINTS = 64
+
+# Fewest bytes a command can move the pen in, as in PA0,0;
+MIN_MOVE_BYTES = 6
+
+# Plotters that only speak the original HP-GL, and so can't take PE commands
+NO_PE_MODELS = [b"7475A"]
+
+# Largest x and y that can be drawn at on each size of paper
+PAPER_SIZES = {
+    "US-A": (10365, 7962),
+    "US-B": (16640, 10365),
+    "MET-A4": (11040, 7721),
+    "MET-A3": (16158, 11040),
+}
+DEFAULT_PAPER_SIZE = "MET-A4"
+
+# Space left clear around the edge of the page by fit_page(), 5mm in plotter
+# units
+DEFAULT_MARGIN = 200
 
 class Plotter():
 
     def __init__(self, verbose=False, baudrate=9600, addr=5, gpib=True,
-                 paper_size="MET-A4", dryrun=False,
-                 device="/dev/ttyUSB0"):
+                 paper_size=DEFAULT_PAPER_SIZE, dryrun=False,
+                 device="/dev/ttyUSB0", buffered=False, buffer_size=None,
+                 encoding="PD", output=None, timeout=5.0, handshake="none",
+                 retries=3, metrics=None, trace_every=1, simplify=0):
 
         self.verbose = verbose
         self.dryrun = dryrun
+        self.gpib = gpib
+        self.baudrate = baudrate
+
+        # If metrics is a filename, count what gets sent and how long is spent
+        # waiting on the plotter, and write it there as JSON at the end
+        self.metrics_file = metrics
+        self.metrics = PlotterMetrics() if metrics is not None else None
+
+        # Logging every command is slow when there are hundreds of thousands
+        # of them, so whether to is only worked out once.  With trace_every
+        # set to N, only every Nth command is logged.
+        self._trace = logging.getLogger().isEnabledFor(logging.DEBUG)
+        self.trace_every = max(int(trace_every), 1)
+        self._commands_sent = 0
+
+        # Polylines are simplified to within this many plotter units before
+        # they're sent, and the points in and out counted for the log
+        self.simplify = simplify
+        self._points_in = 0
+        self._points_out = 0
+
+        # With a serial handshake the port itself stops us overrunning the
+        # plotter, so there's no need to keep asking it whether it's ready
+        if handshake not in HANDSHAKES:
+            raise ValueError("Invalid handshake selected")
+        self.handshake = handshake
+
+        # If output is a filename the HPGL goes there instead of to the
+        # plotter, so it can be played back later with playback.py.  It can
+        # also be anything with write() and close(), such as an estimator.
+        self.output = output
+
+        # In buffered mode commands are packed together and written in
+        # batches sized against the plotter's input buffer, instead of polling
+        # the plotter with OS; before every single command.  Buffering only
+        # switches on once we're inside the context manager and the buffer
+        # size is known.
+        self.buffered = buffered
+        self.buffer_size = buffer_size
+        self._buffering = False
+        self._pending = bytearray()
+        self._unconfirmed = 0
 
         self.current_x = None
         self.current_y = None
+        self.pen = None
 
-        if dryrun is False:
-            self.serial = serial.Serial(device)
-            logging.info("Opened serial port {}".format(self.serial.name))
-        else:
+        # Points for the PD command currently being built up, as a flat list
+        # of x, y, x, y...  Segments that carry on from where the last one
+        # ended are added to it, rather than sent as a command each.
+        self._polyline = []
+
+        # Lines can either go out as plain PD commands, or on HP-GL/2 plotters
+        # as PE commands, which carry the same points in far fewer bytes.  A PE
+        # command starts with its own pen up move, so it also remembers where
+        # the line it's building started.
+        if encoding not in ["PD", "PE"]:
+            raise ValueError("Invalid encoding selected")
+        self.encoding = encoding
+        self._polyline_start = None
+
+        if dryrun is True:
             self.serial = {}
             logging.info("Not sending commands to serial port")
+        elif isinstance(output, str):
+            # There's no telling what plotter a file will be played back on,
+            # so it's written in the encoding every plotter understands
+            if self.encoding == "PE":
+                logging.info("Writing PD commands rather than PE to file")
+                self.encoding = "PD"
+            self.serial = open(output, "wb")
+            logging.info("Writing HPGL to file {}".format(output))
+        elif output is not None:
+            self.serial = output
+            logging.debug("Writing HPGL to {}".format(output.name))
+        elif isinstance(device, str):
+            self.serial = open_port(device, baudrate=baudrate,
+                                    timeout=timeout, handshake=handshake)
+            logging.info("Opened serial port {}".format(self.serial.name))
+        else:
+            # Anything that looks like a serial port, such as a
+            # SimulatedPlotter, can be used in place of one
+            self.serial = device
+            logging.info("Using device {}".format(self.serial.name))
+
+        # A simulated device keeps its own clock, so waiting on it has to
+        # move that clock on rather than sleep for real
+        self.link = PlotterLink(self.serial, timeout=timeout, retries=retries,
+                                sleep=getattr(self.serial, "sleep",
+                                              time.sleep),
+                                metrics=self.metrics)
 
         # This command is for the Prologix GPIB controller.
         # addr should be set equal to the GPIB number of the device
-        if gpib is True:
-            self._send_raw("++addr {}".format(addr))
+        if gpib is True and output is None:
+            self._send_raw(b"++addr %d" % addr)
 
         # Paper size can be "A" (8.5x11 in) or "B" (11x17 in). Depending on
         # the paper size the plotter has different coordinate
@@ -35,22 +153,14 @@ class Plotter():
         # For B/A3 paper:  Origin is top left, and the paper is portrait
         self.xmin = self.ymin = 0
         self.paper_size = paper_size
-        if paper_size == "US-A":
-            self.xmax = 10365
-            self.ymax = 7962
-        elif paper_size == "US-B":
-            self.xmax = 16640
-            self.ymax = 10365
-        elif paper_size == "MET-A4":
-            self.xmax = 11040
-            self.ymax = 7721
-        elif paper_size == "MET-A3":
-            self.xmax = 16158
-            self.ymax = 11040
-        else:
+        if paper_size not in PAPER_SIZES:
             raise ValueError("Invalid paper size selected")
+        self.xmax, self.ymax = PAPER_SIZES[paper_size]
 
+        # Drawing coordinates are turned into plotter units by self.transform,
+        # which set_image_scale(), fit_page() and set_transform() change
         self.scale_ratio = 1.0
+        self.transform = transform.Transform()
 
         logging.info("[{}] Set xmin and xmax to [{}, {}]".format(
             paper_size, self.xmin, self.xmax))
@@ -61,82 +171,344 @@ class Plotter():
         """When you enter the context manager, send the commands that start the
         datastream and select pen 1
         """
-        self._send_raw("IN;")
-        model = self._send_raw("OI;", read=True)
-        resolution = self._send_raw("OF;", read=True)
+        if self.metrics is not None:
+            self.metrics.start()
+
+        self._send_raw(b"IN;")
+        if (self.handshake != "none" and self.gpib is False and
+                self.dryrun is False and self.output is None):
+            # Have the plotter use the same handshake as the port
+            self.link.write("\x1b.P{}:".format(
+                HANDSHAKES[self.handshake]).encode("ascii"))
+        model = self._send_raw(b"OI;", read=True)
+        resolution = self._send_raw(b"OF;", read=True)
         logging.debug("{} plotter has plotting resolution {}".format(
             model, resolution))
 
-        self._send_raw("SP1;")
+        if self.encoding == "PE" and model in NO_PE_MODELS:
+            logging.warning("{} plotter can't take PE commands, falling back "
+                            "to PD".format(model))
+            self.encoding = "PD"
+
+        if (self.buffered is True and self.dryrun is False and
+                self.output is None):
+            if self.buffer_size is None:
+                self.buffer_size = self._query_buffer_size()
+            logging.info("Buffering output, plotter buffer is {} bytes".format(
+                self.buffer_size))
+            self._buffering = True
+
+        self.select_pen(1)
         return self
 
     def __exit__(self, *args):
         """When you exit the context manager, send a command to put the pen away
         because neatness is important
         """
-        self._send_raw("SP0;")
+        self.select_pen(0)
+        self.flush()
+        self._buffering = False
+
+        if self.output is not None and self.dryrun is False:
+            self.serial.close()
+
+        if self.simplify > 0 and self._points_in > 0:
+            logging.info("Simplified polylines from {} to {} points "
+                         "({:.1f}% fewer)".format(
+                             self._points_in, self._points_out,
+                             100.0 * (1 - self._points_out /
+                                      float(self._points_in))))
+
+        if self.metrics is not None:
+            self.metrics.stop()
+            self.metrics.dump(self.metrics_file, baudrate=self.baudrate)
 
-    def _send_raw(self, string, read=False):
-        """Convert whatever is in string to bytes and send it to the serial port
+    def _send_raw(self, command, read=False):
+        """Send a command to the serial port.  Commands are built as bytes, but
+        strings are converted too.
         """
-        logging.debug("[SEND-TO-PORT]: {}".format(string))
+        command = self._to_bytes(command)
+        if self._trace is True:
+            self._commands_sent += 1
+            if self._commands_sent % self.trace_every == 0:
+                logging.debug("[SEND-TO-PORT]: %s", command)
+        if self.metrics is not None:
+            self.metrics.record_command(command)
         if self.dryrun is True:
             return
 
+        # There's nothing to answer queries in a file, and nothing to wait for
+        if self.output is not None:
+            if read is False:
+                self.serial.write(command+b"\r")
+            return
+
+        if self._buffering is True and read is False:
+            self._queue(command)
+            return
+
+        # Anything already queued has to go out before this command does
+        self.flush()
+
         # Check if the plotter is ready for input
-        while True:
-            self.serial.write(b"OS;"+b"\r")
-            status = self.serial.readline().rstrip(b"\r\n")
-            status_bin = "{0:b}".format(int(status))
-            ready = status_bin[-5]
-            if ready == "1":
-                # We're good... a 1 in the 16 value (position 4) part of this
-                # binary number means "Send me data"
-                break
-            logging.warning("Buffer full.  Plotter asked for more time...")
-            time.sleep(0.01)
+        if self.handshake == "none":
+            self.link.wait_until(
+                self._plotter_ready,
+                "Buffer full.  Plotter asked for more time...",
+                kind="status_poll")
+            self._unconfirmed = 0
 
         # The actual send
-        self.serial.write(bytes(string, "utf-8")+b"\r")
-
         if read is True:
-            return self.serial.readline().rstrip(b"\r\n")
+            return self.link.query(command+b"\r")
+        self.link.write(command+b"\r")
+        self._unconfirmed += len(command) + 1
+
+    def _to_bytes(self, string):
+        if isinstance(string, bytes):
+            return string
+        return bytes(string, "utf-8")
+
+    def _plotter_ready(self):
+        """Ask the plotter for its status byte.  A 1 in the 16 value (position
+        4) part of this number means "Send me data".  Because the plotter
+        answers OS; in turn with everything else, a reply also means that
+        everything sent before it has been consumed.
+        """
+        # The reply comes after everything not yet confirmed has been drawn,
+        # so allow for that, and don't ask again just because it's slow
+        if self._unconfirmed > 0 and self.link.timeout is not None:
+            status = self.link.query(
+                b"OS;"+b"\r", timeout=(self.link.timeout +
+                                       self._drawing_time(self._unconfirmed)),
+                retries=0)
+        else:
+            status = self.link.query(b"OS;"+b"\r")
+        return int(status) & 16 == 16
+
+    def _drawing_time(self, nbytes):
+        """The longest the plotter could take to carry out nbytes of
+        commands: as if every MIN_MOVE_BYTES of them took the pen up, across
+        the whole page and down again, at full speed"""
+        diagonal = math.hypot(self.xmax - self.xmin, self.ymax - self.ymin)
+        per_move = diagonal / PEN_SPEED + 2 * PEN_LIFT_TIME
+        return nbytes / float(MIN_MOVE_BYTES) * per_move
+
+    def _query_buffer_size(self):
+        """Find out how big the plotter's input buffer is.  Over RS-232 the
+        plotter answers ESC.B directly; device control sequences don't make it
+        through the GPIB controller so there we fall back to the default.
+        """
+        if self.gpib is True:
+            return DEFAULT_BUFFER_SIZE
+
+        size = int(self.link.query(b"\x1b.B"))
+        logging.debug("Plotter reports a buffer of {} bytes".format(size))
+        return size
+
+    def _free_buffer_space(self):
+        """Over RS-232, ESC.L reports the free buffer space immediately"""
+        return int(self.link.query(b"\x1b.L"))
+
+    def _space_for(self, nbytes):
+        """The free space in the plotter's buffer if there's room for nbytes,
+        otherwise 0"""
+        free = self._free_buffer_space()
+        return free if free >= nbytes else 0
+
+    def _queue(self, command):
+        """Add a command to the pending batch, sending the batch off first if
+        adding this command would make it too big"""
+        # Only use half the buffer per batch, so one batch can be drawing while
+        # the next one is arriving
+        batch_size = max(self.buffer_size // 2, 1)
+        if len(self._pending) + len(command) + 1 > batch_size:
+            self.flush()
+        self._pending += command
+
+    def flush(self):
+        """Write any queued commands to the plotter in a single write.  The
+        plotter is only asked about its buffer when the batch could overflow
+        it."""
+        if self.dryrun is True or len(self._pending) == 0:
+            return
+
+        batch = bytes(self._pending) + b"\r"
+        self._pending = bytearray()
+
+        if (self.handshake == "none" and
+                self._unconfirmed + len(batch) > self.buffer_size):
+            self._wait_for_space(len(batch))
+
+        self.link.write(batch)
+        self._unconfirmed += len(batch)
+
+    def _wait_for_space(self, nbytes):
+        """Block until the plotter can take nbytes more without overflowing"""
+        if self.gpib is True:
+            self.link.wait_until(
+                self._plotter_ready,
+                "Buffer full.  Plotter asked for more time...",
+                kind="buffer_full")
+            self._unconfirmed = 0
+            return
+
+        free = self.link.wait_until(lambda: self._space_for(nbytes),
+                                    kind="buffer_full")
+        self._unconfirmed = self.buffer_size - free
 
     def set_image_scale(self, img_size):
 
         ratio_x = float(self.xmax) / img_size[0]
         ratio_y = float(self.ymax) / img_size[1]
         self.scale_ratio = min([ratio_x, ratio_y])
+        self.transform = transform.Transform(scale=self.scale_ratio)
         logging.debug("Image scale ratio: {}".format(self.scale_ratio))
 
+    def set_transform(self, t):
+        """Use the transform.Transform `t` to put drawing coordinates on the
+        page"""
+        self.transform = t
+
+    def page(self, margin=0):
+        """The area that can be drawn on, less `margin` all round, as
+        ((xmin, xmax), (ymin, ymax))"""
+        return ((self.xmin + margin, self.xmax - margin),
+                (self.ymin + margin, self.ymax - margin))
+
+    def fit_page(self, bounds, margin=DEFAULT_MARGIN, rotation=0):
+        """Scale a drawing covering bounds, ((xmin, xmax), (ymin, ymax)), to
+        fill the page and centre it, after rotating it by `rotation`
+        degrees"""
+        self.transform = transform.fit(bounds, self.page(), margin=margin,
+                                       rotation=rotation)
+
+
+    def select_pen(self, pen):
+        """Put the current pen away and pick up pen number `pen`, or just put
+        it away if pen is 0.  Does nothing if that pen is already in hand, so
+        drawings can ask for the pen they want before each layer."""
+        if pen == self.pen:
+            return
+        self._end_polyline()
+        self._send_raw(b"SP%d;" % pen)
+        self.pen = pen
+
+    def write_hpgl(self, command):
+        """Send a ready made HPGL command, or several, to the plotter"""
+        self._end_polyline()
+        self._forget_position()
+        self._send_raw(command)
+
+    def _end_polyline(self):
+        """Send the PD command for any points that have been joined up"""
+        if len(self._polyline) == 0:
+            return
+        if self.encoding == "PE":
+            self._send_raw(hpgl_pe.encode_pe(
+                list(self._polyline_start) + self._polyline))
+        else:
+            self._send_raw(b"PD" + b",".join(
+                [b"%d" % v for v in self._polyline]) + b";")
+        self._polyline = []
+
+    def _pen_up_to(self, x, y):
+        self._end_polyline()
+        # PE commands begin with their own pen up move
+        if self.encoding != "PE":
+            self._send_raw(b"PU%d,%d;" % (x, y))
+        self.current_x = x
+        self.current_y = y
+
+    def _pen_down_to(self, x, y):
+        max_points = (MAX_PE_POINTS if self.encoding == "PE"
+                      else MAX_POLYLINE_POINTS)
+        if len(self._polyline) >= 2 * max_points:
+            self._end_polyline()
+        if len(self._polyline) == 0:
+            self._polyline_start = (self.current_x, self.current_y)
+        if self.metrics is not None:
+            self.metrics.record_segment(math.hypot(x - self.current_x,
+                                                   y - self.current_y))
+        self._polyline.append(x)
+        self._polyline.append(y)
+        self.current_x = x
+        self.current_y = y
+
+    def _forget_position(self):
+        """After commands that move the pen by themselves we no longer know
+        where it is, so the next segment has to start with a PU"""
+        self.current_x = None
+        self.current_y = None
+
+    def _draw_polyline(self, points):
+        """Draw through a list of [x, y] points already in plotter units"""
+        x_from, y_from = points[0]
+        if not (self.current_x == x_from and self.current_y == y_from):
+            self._pen_up_to(x_from, y_from)
+
+        for x, y in points[1:]:
+            self._pen_down_to(x, y)
 
     def write_segment(self, segment):
-        point_from = segment[0]*self.scale_ratio
-        point_to = segment[1]*self.scale_ratio
+        self.write_segments([segment])
+
+    def write_segments(self, segments):
+        """Draw an (n, 2, 2) array of segments, all transformed at once.
+        Segments too short to be seen in plotter units are left out."""
+        self.write_quantized(self.quantize_segments(segments))
+
+    def write_polyline(self, points):
+        """Draw a connected line through an (n, 2) array of points, which are
+        transformed in the same way as for write_segment"""
+        self.write_polylines([points])
+
+    def write_polylines(self, lines):
+        """Draw each of a list of polylines, all transformed, and simplified
+        if asked, at once"""
+        self.write_quantized(self.quantize_polylines(lines))
+
+    def quantize_segments(self, segments):
+        """The segments write_segments would draw, as lists of [x, y] points
+        in plotter units"""
+        # Plain ints are quicker to work with one at a time than numpy's
+        return self.transform.to_segments(segments).tolist()
 
-        if not (self.current_x == point_from[0] and
-                self.current_y == point_from[1]):
-            self._send_raw("PU{},{};".format(int(point_from[0]),
-                                            int(point_from[1])))
+    def quantize_polylines(self, lines):
+        """The lines write_polylines would draw, as lists of [x, y] points in
+        plotter units.  Only this looks at the transform, so it can be done
+        on one thread while another sends the lines before."""
+        lines = list(lines)
+        self._points_in += sum(len(line) for line in lines)
+        quantized = []
+        for line in self.transform.to_polylines(lines,
+                                                tolerance=self.simplify):
+            if len(line) >= 2:
+                self._points_out += len(line)
+                quantized.append(line.tolist())
+        return quantized
 
-        self._send_raw("PD{},{};".format(int(point_to[0]),
-                                         int(point_to[1])))
-        self.current_x = point_to[0]
-        self.current_y = point_to[1]
+    def write_quantized(self, lines):
+        """Draw lists of [x, y] points already in plotter units"""
+        for line in lines:
+            self._draw_polyline(line)
 
     def write_circle(self, center, radius):
-        self._send_raw("PA{},{};".format(int(center[0]),
-                                            int(center[1])))
-        self._send_raw("CI{},45;".format(radius))
+        self._end_polyline()
+        self._send_raw(b"PA%d,%d;" % (int(center[0]), int(center[1])))
+        # The radius needn't be a whole number of plotter units
+        self._send_raw(b"CI%g,45;" % radius)
+        self._forget_position()
 
     def write_square(self, center, size):
-        self._send_raw("PU{},{};".format(int(center[0]-size/2.0),
-                                        int(center[1]-size/2.0)))
-        self._send_raw("PD{},{};".format(int(center[0]-size/2.0),
-                                        int(center[1]+size/2.0)))
-        self._send_raw("PD{},{};".format(int(center[0]+size/2.0),
-                                        int(center[1]+size/2.0)))
-        self._send_raw("PD{},{};".format(int(center[0]+size/2.0),
-                                        int(center[1]-size/2.0)))
-        self._send_raw("PD{},{};".format(int(center[0]-size/2.0),
-                                        int(center[1]-size/2.0)))
+        self._end_polyline()
+        left = int(center[0] - size / 2.0)
+        right = int(center[0] + size / 2.0)
+        bottom = int(center[1] - size / 2.0)
+        top = int(center[1] + size / 2.0)
+        self._send_raw(b"PU%d,%d;" % (left, bottom))
+        self._send_raw(b"PD%d,%d;" % (left, top))
+        self._send_raw(b"PD%d,%d;" % (right, top))
+        self._send_raw(b"PD%d,%d;" % (right, bottom))
+        self._send_raw(b"PD%d,%d;" % (left, bottom))
+        self._forget_position()
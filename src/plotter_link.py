@@ -0,0 +1,139 @@
+"""The connection to the plotter underneath Plotter.
+
+PlotterLink owns the serial port and makes sure nothing waits on it forever.
+Replies are waited for by polling in_waiting, backing off a little more each
+time, instead of sitting in a blocking readline().  If the plotter doesn't
+answer in time the input buffer is cleared and the query tried again, and if
+it still won't answer a PlotterTimeoutError is raised rather than hanging.
+"""
+import logging
+import time
+
+import serial
+
+# Handshakes the serial port can use to stop us overrunning the plotter's
+# buffer.  The value is the mode given to the plotter's ESC.P instruction
+# so that it uses the same handshake at its end.
+HANDSHAKES = {
+    "none": 0,
+    "xonxoff": 1,
+    "rtscts": 3,
+}
+
+
+class PlotterTimeoutError(IOError):
+    """The plotter didn't answer, or couldn't take data, in time"""
+
+
+def open_port(device, baudrate=9600, timeout=5.0, handshake="none"):
+    """Open a serial port to the plotter, with timeouts so a wedged plotter
+    can't hang us, and with the chosen handshake"""
+    if handshake not in HANDSHAKES:
+        raise ValueError("Invalid handshake selected")
+    return serial.Serial(device, baudrate=baudrate, timeout=timeout,
+                         write_timeout=timeout,
+                         xonxoff=handshake == "xonxoff",
+                         rtscts=handshake == "rtscts")
+
+
+class PlotterLink(object):
+
+    def __init__(self, port, timeout=5.0, retries=3, backoff=0.01,
+                 max_backoff=0.05, sleep=time.sleep, metrics=None):
+        self.port = port
+        self.metrics = metrics
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sleep = sleep
+
+        # Whether a wait_until() is going on, which replies read during it
+        # count towards already
+        self._waiting = False
+
+    def write(self, data):
+        try:
+            self.port.write(data)
+        except serial.SerialTimeoutException as e:
+            raise PlotterTimeoutError("Plotter stopped taking data") from e
+        if self.metrics is not None:
+            self.metrics.record_write(len(data))
+
+    def wait_until(self, ready, message=None, kind="wait"):
+        """Call ready() until it returns something true, sleeping for longer
+        each time it doesn't, and return what it returned.  Time spent here is
+        recorded in the metrics under `kind`."""
+        delay = self.backoff
+        started = time.time()
+        outer, self._waiting = self._waiting, True
+        try:
+            while True:
+                result = ready()
+                if result:
+                    break
+                if message is not None:
+                    logging.warning(message)
+                self.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+        finally:
+            self._waiting = outer
+        if self.metrics is not None and outer is False:
+            self.metrics.record_wait(kind, time.time() - started)
+        return result
+
+    def read_reply(self, timeout=None):
+        """Wait for the plotter to send back a line, and return it without
+        its line ending.  Gives up after `timeout` seconds, or the link's own
+        timeout if that's not given.  The wait is recorded in the metrics as a reply,
+        unless it's part of a wait_until(), which records it itself."""
+        if timeout is None:
+            timeout = self.timeout
+        waited = 0.0
+        delay = self.backoff
+        started = time.time()
+        while self.port.in_waiting == 0:
+            if timeout is not None and waited >= timeout:
+                raise PlotterTimeoutError(
+                    "No reply from plotter after {}s".format(waited))
+            self.sleep(delay)
+            waited += delay
+            delay = min(delay * 2, self.max_backoff)
+
+        reply = self.port.readline()
+        if self.metrics is not None and self._waiting is False:
+            self.metrics.record_wait("reply", time.time() - started)
+        if not reply.endswith((b"\r", b"\n")):
+            raise PlotterTimeoutError(
+                "Plotter stopped part way through a reply: {!r}".format(reply))
+        return reply.rstrip(b"\r\n")
+
+    def recover(self):
+        """Throw away anything half read, so the next reply we read is the
+        answer to the next question we ask"""
+        logging.warning("Plotter timed out, clearing input and retrying")
+        self.port.reset_input_buffer()
+
+    def query(self, command, timeout=None, retries=None):
+        """Send command, which must ask the plotter a question, and return its
+        answer.  Each try waits `timeout` seconds for the answer, or the
+        link's own timeout, and gives up after `retries` retries, or the
+        link's own number of them.
+
+        Before asking again, the answer to the last try is waited for once
+        more.  If it was only late it's used, rather than asking again and
+        having it read as the answer to the next question."""
+        if retries is None:
+            retries = self.retries
+        for attempt in range(retries + 1):
+            self.write(command)
+            try:
+                return self.read_reply(timeout)
+            except PlotterTimeoutError:
+                if attempt == retries:
+                    raise
+                self.recover()
+            try:
+                return self.read_reply(timeout)
+            except PlotterTimeoutError:
+                pass
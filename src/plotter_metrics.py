@@ -0,0 +1,90 @@
+"""Counters for what Plotter sends and where it spends its time waiting.
+
+Turned on by giving Plotter a filename for metrics, in which case they're
+written out as JSON when the plotter is put away.  Recording is just a few
+dictionary updates, so it's cheap enough to leave on for big drawings.
+"""
+import collections
+import json
+import logging
+import time
+
+from simulated_plotter import BITS_PER_BYTE
+
+
+class PlotterMetrics(object):
+
+    def __init__(self):
+        self.commands = collections.Counter()
+        self.command_bytes = collections.Counter()
+        self.wait_time = collections.Counter()
+        self.waits = collections.Counter()
+        self.bytes_written = 0
+        self.writes = 0
+
+        # Segment lengths in plotter units, binned by powers of two: bin n
+        # counts lengths from 2**(n-1) up to 2**n
+        self.segment_lengths = collections.Counter()
+
+        self.started = None
+        self.finished = None
+
+    def start(self):
+        self.started = time.time()
+
+    def stop(self):
+        self.finished = time.time()
+
+    def record_command(self, command):
+        """Count an HPGL command, or several run together, by opcode"""
+        for part in command.split(b";"):
+            part = part.strip()
+            if len(part) == 0:
+                continue
+            opcode = part[:2].decode("ascii", "replace").upper()
+            self.commands[opcode] += 1
+            self.command_bytes[opcode] += len(part) + 1
+
+    def record_write(self, nbytes):
+        self.writes += 1
+        self.bytes_written += nbytes
+
+    def record_wait(self, kind, seconds):
+        self.waits[kind] += 1
+        self.wait_time[kind] += seconds
+
+    def record_segment(self, length):
+        self.segment_lengths[int(length).bit_length()] += 1
+
+    def to_dict(self, baudrate=9600):
+        elapsed = None
+        utilization = None
+        if self.started is not None:
+            elapsed = (self.finished or time.time()) - self.started
+            if elapsed > 0:
+                utilization = (self.bytes_written * BITS_PER_BYTE /
+                               float(baudrate) / elapsed)
+
+        histogram = collections.OrderedDict()
+        for n in sorted(self.segment_lengths):
+            low = 0 if n == 0 else 2 ** (n - 1)
+            histogram["{}-{}".format(low, 2 ** n - 1)] = \
+                self.segment_lengths[n]
+
+        return {
+            "elapsed": elapsed,
+            "baudrate": baudrate,
+            "baud_utilization": utilization,
+            "bytes_written": self.bytes_written,
+            "writes": self.writes,
+            "commands": dict(self.commands),
+            "command_bytes": dict(self.command_bytes),
+            "waits": dict(self.waits),
+            "wait_time": dict(self.wait_time),
+            "segment_lengths": histogram,
+        }
+
+    def dump(self, filename, baudrate=9600):
+        with open(filename, "w") as f:
+            json.dump(self.to_dict(baudrate=baudrate), f, indent=2)
+        logging.info("Wrote plotter metrics to {}".format(filename))
@@ -0,0 +1,91 @@
+"""Quick previews of drawings, shared by all of them.
+
+Lines are drawn with a single matplotlib LineCollection rather than a plot()
+call each, and drawings too big to see the detail of anyway are thinned out
+first, so showing a preview takes a fraction of the time it took to compute
+the drawing.
+"""
+import logging
+
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+import numpy as np
+
+IMG_SCALE = 8
+
+# Past this many points a preview is thinned out before being drawn
+MAX_PREVIEW_POINTS = 200000
+
+
+def _as_lines(lines):
+    """Accept an (n, 2, 2) array of segments, an (n, 2) array making a single
+    polyline, or a list of (k, 2) polylines, and return a list of arrays"""
+    if isinstance(lines, np.ndarray):
+        if lines.ndim == 2:
+            return [lines]
+        return list(lines)
+    return [np.asarray(line) for line in lines]
+
+
+def decimate(lines, max_points=MAX_PREVIEW_POINTS, seed=0):
+    """Thin out a list of lines until there are roughly max_points points in
+    total.  Long polylines keep every nth point, and segments too short to
+    thin are kept at random, so the overall look of the drawing is kept."""
+    lines = _as_lines(lines)
+    total = sum(len(line) for line in lines)
+    if total <= max_points:
+        return lines
+
+    factor = float(total) / max_points
+    step = int(np.ceil(factor))
+    rs = np.random.RandomState(seed)
+    keep_short = rs.random_sample(len(lines)) < 1.0 / factor
+
+    thinned = []
+    for line, keep in zip(lines, keep_short):
+        if len(line) > 2 * step:
+            idx = np.append(np.arange(0, len(line) - 1, step), len(line) - 1)
+            thinned.append(line[idx])
+        elif keep:
+            thinned.append(line)
+
+    logging.debug("Thinned preview from {} to {} points".format(
+        total, sum(len(line) for line in thinned)))
+    return thinned
+
+
+def show_lines(lines, bounds=None, linewidth=0.5, max_points=MAX_PREVIEW_POINTS):
+    """Show lines in a matplotlib window without blocking.  bounds is
+    ((xmin, xmax), (ymin, ymax)); without it the view fits the lines."""
+    return show_layers([lines], ["k"], bounds=bounds, linewidth=linewidth,
+                       max_points=max_points)
+
+
+def show_layers(layers, colors, bounds=None, linewidth=0.5,
+                max_points=MAX_PREVIEW_POINTS):
+    """Like show_lines, but for a drawing made with several pens.  Each
+    layer of lines is drawn in its matching color, and is thinned out by
+    itself so that light layers aren't lost next to heavy ones."""
+    fig, ax = plt.subplots()
+    for lines, color in zip(layers, colors):
+        lines = decimate(lines, max_points=max_points // len(layers))
+        ax.add_collection(LineCollection(lines, colors=color,
+                                         linewidths=linewidth))
+
+    if bounds is None:
+        ax.autoscale()
+        (xmin, xmax), (ymin, ymax) = ax.get_xlim(), ax.get_ylim()
+    else:
+        (xmin, xmax), (ymin, ymax) = bounds
+        ax.set_xlim([xmin, xmax])
+        ax.set_ylim([ymin, ymax])
+
+    aspect_ratio = float(xmax - xmin) / max(ymax - ymin, 1e-9)
+    fig.set_size_inches(IMG_SCALE*aspect_ratio, IMG_SCALE)
+    ax.set_aspect("equal")
+    ax.get_xaxis().set_visible(False)
+    ax.get_yaxis().set_visible(False)
+
+    plt.show(block=False)
+    return fig
+
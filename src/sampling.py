@@ -0,0 +1,117 @@
+"""Darkness weighted point sampling, shared by the drawings that scatter points
+over an image.  Everything here works on whole arrays at once, so the cost is a
+handful of numpy passes over the image rather than a python loop per pixel."""
+import logging
+
+import numpy as np
+
+
+def get_random_state(seed=None):
+    """Return a numpy RandomState.  Passing the same seed twice gives the same
+    stream of numbers, passing None gives a fresh unpredictable one.  An
+    existing RandomState is passed straight through.
+    """
+    if isinstance(seed, np.random.RandomState):
+        return seed
+    return np.random.RandomState(seed)
+
+
+def bernoulli_sample(density, count, seed=None, total=None, overwrite=False):
+    """Visit every pixel once and keep it with probability proportional to its
+    density, scaled so that on average `count` pixels are kept.  This is the
+    same scheme the drawings always used, so the number of points returned
+    varies a little from run to run.
+
+    If density is one tile of something bigger, `total` is the sum of the
+    whole thing, and count is shared out over all of it.  With overwrite set
+    the density is scaled in place rather than copied.
+
+    Returns an (n, 2) integer array of (row, column) pixel indices.
+    """
+    rs = get_random_state(seed)
+    if total is None:
+        total = np.sum(density)
+    if total <= 0:
+        return np.zeros((0, 2), dtype=int)
+
+    scale = float(count) / total
+    if overwrite is True:
+        prob = np.multiply(density, scale, out=density)
+    else:
+        prob = density * scale
+    keep = prob > rs.random_sample(prob.shape)
+    return np.argwhere(keep)
+
+
+def exact_sample(density, count, seed=None):
+    """Draw exactly `count` distinct pixels, with probability proportional to
+    their density.  If fewer than `count` pixels have any density at all then
+    every one of them is returned.
+
+    Returns an (n, 2) integer array of (row, column) pixel indices.
+    """
+    rs = get_random_state(seed)
+    flat = np.ravel(density).astype(float)
+    nonzero = np.count_nonzero(flat > 0)
+    if nonzero == 0:
+        return np.zeros((0, 2), dtype=int)
+
+    count = min(count, nonzero)
+    idx = rs.choice(flat.size, size=count, replace=False, p=flat / flat.sum())
+    idx.sort()
+    return np.column_stack(np.unravel_index(idx, density.shape))
+
+
+def _share_out(count, weights, room, rs):
+    """Share `count` points out between tiles at random, in proportion to
+    their weights, but giving no tile more than its room.  Whatever a tile
+    has no room for is shared out again between the tiles that still have
+    some, so the counts add up to count, or to all the room there is."""
+    counts = np.zeros(len(weights), dtype=int)
+    left = min(count, int(np.sum(room)))
+    while left > 0:
+        weights = np.where(counts < room, weights, 0)
+        counts += rs.multinomial(left, weights / np.sum(weights))
+        counts = np.minimum(counts, room)
+        left = min(count, int(np.sum(room))) - int(np.sum(counts))
+    return counts
+
+
+def sample_tiled(tiles, count, exact=False, seed=None):
+    """Scatter roughly (or, if `exact` is set, exactly) `count` points over
+    a density too big to hold at once, and log how many were generated.
+    `tiles` is called to get an iterator over (first row, density) for bands
+    of rows covering the whole density, such as ImageSource.darkness_tiles.
+    It's called twice, once to add up the density and once to sample it, and
+    only one tile is looked at at a time.  Tiles may be changed in place."""
+    rs = get_random_state(seed)
+
+    sums = []
+    inked = []
+    for _, tile in tiles():
+        sums.append(np.sum(tile, dtype=np.float64))
+        inked.append(np.count_nonzero(tile))
+    sums = np.array(sums)
+    total = np.sum(sums)
+    if total <= 0:
+        logging.info("Points requested: {}".format(count))
+        logging.info("Actual points generated: 0")
+        return np.zeros((0, 2), dtype=int)
+
+    if exact is True:
+        counts = _share_out(count, sums, np.array(inked), rs)
+
+    found = []
+    for i, (top, tile) in enumerate(tiles()):
+        if exact is True:
+            points = exact_sample(tile, counts[i], seed=rs)
+        else:
+            points = bernoulli_sample(tile, count, seed=rs, total=total,
+                                      overwrite=True)
+        points[:, 0] += top
+        found.append(points)
+
+    points = np.concatenate(found)
+    logging.info("Points requested: {}".format(count))
+    logging.info("Actual points generated: {}".format(len(points)))
+    return points
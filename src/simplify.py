@@ -0,0 +1,86 @@
+"""Thin out polylines without visibly changing them.
+
+Drawings like the spiral and the spline curve are made of far more points
+than the plotter can show, many of them under a plotter unit apart.  This
+is Ramer-Douglas-Peucker simplification: a run of points is replaced by a
+straight line between its ends unless some point strays more than
+`tolerance` from it, in which case the run is split at that point and each
+half looked at again.
+
+Rather than recursing, every run still being looked at, across every line,
+is handled in the same numpy pass, so there's one pass per level of
+splitting rather than one python call per run.
+"""
+import numpy as np
+
+# Lines are cut into runs of at most this many points before simplifying.
+# Splitting a long run tends to peel a few points off its end at a time, so
+# without this a spiral of a million points takes hundreds of passes over
+# nearly all of them.  Keeping one extra point in every MAX_RUN costs next to
+# nothing.
+MAX_RUN = 512
+
+
+def _distances(points, starts, ends, run, idx):
+    """Distance from each points[idx] to the segment between the start and
+    end of its run"""
+    a = points[starts][run]
+    ab = points[ends][run] - a
+    ap = points[idx] - a
+    length2 = np.sum(ab * ab, axis=1)
+    t = np.sum(ap * ab, axis=1) / np.where(length2 > 0, length2, 1)
+    t = np.clip(t, 0, 1)
+    return np.hypot(*(ap - t[:, None] * ab).T)
+
+
+def rdp_mask(points, lengths, tolerance, max_run=MAX_RUN):
+    """Given the points of several polylines joined together, and how many
+    points each line has, return a boolean array marking the points to keep.
+    The first and last points of every line are always kept, as is every
+    max_run'th point."""
+    points = np.asarray(points, dtype=float)
+    lengths = np.asarray(lengths)
+    keep = np.zeros(len(points), dtype=bool)
+
+    ends = np.cumsum(lengths) - 1
+    starts = ends - lengths + 1
+    nonempty = lengths > 0
+    keep[starts[nonempty]] = True
+    keep[ends[nonempty]] = True
+
+    # Cut long lines into runs
+    line = np.repeat(np.arange(len(lengths)), lengths)
+    offset = np.arange(len(points)) - starts[line]
+    keep[offset % max_run == 0] = True
+    kept = np.flatnonzero(keep)
+    same_line = line[kept[1:]] == line[kept[:-1]]
+    starts = kept[:-1][same_line]
+    ends = kept[1:][same_line]
+    more = ends - starts > 1
+    starts = starts[more]
+    ends = ends[more]
+
+    while len(starts) > 0:
+        # Every point strictly inside every run
+        inside = ends - starts - 1
+        run = np.repeat(np.arange(len(starts)), inside)
+        first = np.cumsum(inside) - inside
+        idx = np.arange(np.sum(inside)) - first[run] + starts[run] + 1
+
+        # The point furthest from the line in each run
+        d = _distances(points, starts, ends, run, idx)
+        order = np.lexsort((d, run))
+        furthest = order[np.cumsum(inside) - 1]
+
+        split = d[furthest] > tolerance
+        middle = idx[furthest][split]
+        keep[middle] = True
+
+        starts, ends = (np.concatenate([starts[split], middle]),
+                        np.concatenate([middle, ends[split]]))
+        more = ends - starts > 1
+        starts = starts[more]
+        ends = ends[more]
+
+    return keep
+
@@ -0,0 +1,305 @@
+"""A pretend HP7475A, for trying out Plotter without the real thing.
+
+SimulatedPlotter looks enough like a serial.Serial that it can be handed to
+Plotter as its device.  Instead of moving a pen it keeps a virtual clock:
+bytes take time to cross the wire at the configured baud rate, land in a
+finite input buffer, and are taken out of it one command at a time as the
+pen gets round to them.  Queries are answered when they reach the front of
+the buffer, just like the real plotter, so the cost of every OS; round trip
+shows up in the clock.
+
+Because the clock is virtual, a plot that would take hours runs in seconds,
+and runs are repeatable.
+"""
+import collections
+import math
+
+import numpy as np
+
+import hpgl_pe
+
+# Serial framing: 1 start bit, 8 data bits, 1 stop bit
+BITS_PER_BYTE = 10
+
+# Fastest pen speed of the HP7475A, 38.1 cm/s, in plotter units (0.025 mm)
+PEN_SPEED = 15240.0
+
+# How long the pen takes to go up or down, in seconds
+PEN_LIFT_TIME = 0.05
+
+# How long the plotter takes to parse a command before acting on it
+COMMAND_TIME = 0.001
+
+# Device control instructions that take parameters, and so run on up to a
+# colon, such as ESC.P1: to set the handshake.  The rest are three bytes.
+PARAMETER_ESCAPES = b"@HIMNPT"
+
+
+class SimulatedPlotter(object):
+
+    def __init__(self, baudrate=9600, buffer_size=1024, model=b"7475A",
+                 gpib=True, addr=5, handshake=True, pen_speed=PEN_SPEED,
+                 pen_lift_time=PEN_LIFT_TIME, command_time=COMMAND_TIME):
+        """handshake says whether the link holds back data the plotter has no
+        room for, as GPIB and a hardware handshake do, or whether it's lost
+        as it would be on a bare serial line.
+        """
+        self.name = "simulated-{}".format(model.decode("ascii"))
+        self.baudrate = baudrate
+        self.buffer_size = buffer_size
+        self.model = model
+        self.gpib = gpib
+        self.addr = addr
+        self.handshake = handshake
+        self.pen_speed = pen_speed
+        self.pen_lift_time = pen_lift_time
+        self.command_time = command_time
+        self.timeout = None
+
+        # Virtual time, in seconds since the port was opened
+        self.clock = 0.0
+
+        # Commands waiting in the plotter's buffer, with the time each one
+        # finished arriving.  Bytes of a command not yet ended with ; are in
+        # partial.
+        self.buffer = collections.deque()
+        self.buffered_bytes = 0
+        self.partial = b""
+        self.line = b""
+
+        # The plotter finishes whatever it's doing at this time
+        self.busy_until = 0.0
+
+        # Replies, with the time each becomes readable
+        self.replies = collections.deque()
+
+        # The GPIB controller only passes data on to the plotter while it's
+        # addressed to it.  Prologix controllers remember their address from
+        # last time, so it starts out pointing at the plotter.
+        self.addressed = True
+
+        self.x = 0
+        self.y = 0
+        self.pen_down = False
+        self.pen = 0
+
+        self.stats = collections.Counter()
+
+    # The parts of the serial.Serial interface that Plotter uses
+
+    def write(self, data):
+        data = bytes(data)
+        for i in range(len(data)):
+            self.clock += BITS_PER_BYTE / float(self.baudrate)
+            self.stats["bytes_written"] += 1
+            self._receive(data[i:i+1])
+        return len(data)
+
+    def readline(self):
+        if len(self.replies) == 0:
+            # Let the plotter work through its buffer in case a reply is in it
+            self._run(math.inf)
+        if len(self.replies) == 0:
+            # A real port with no timeout would hang here forever
+            return b""
+
+        available, reply = self.replies.popleft()
+        self.clock = max(self.clock, available)
+        self.clock += len(reply) * BITS_PER_BYTE / float(self.baudrate)
+        return reply
+
+    @property
+    def in_waiting(self):
+        self._run(self.clock)
+        return sum(len(r) for t, r in self.replies if t <= self.clock)
+
+    def sleep(self, seconds):
+        """Plotter waits through this instead of time.sleep, so that waiting
+        passes virtual rather than real time"""
+        self.clock += seconds
+        self._run(self.clock)
+
+    def reset_input_buffer(self):
+        self.replies.clear()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    # The plotter itself
+
+    @property
+    def free_space(self):
+        return self.buffer_size - self.buffered_bytes - len(self.partial)
+
+    def finish(self):
+        """Let the plotter draw everything it's been sent, and return the
+        virtual time at which it's done"""
+        self._run(math.inf)
+        self.clock = max(self.clock, self.busy_until)
+        return self.clock
+
+    def _receive(self, byte):
+        """One byte arrives from the controller"""
+        if self.gpib is True:
+            self.line += byte
+            if byte in b"\r\n":
+                line, self.line = self.line.strip(), b""
+                if line.startswith(b"++"):
+                    self._controller_command(line)
+                    return
+            elif self.line.startswith(b"++") or self.line == b"+":
+                return
+            if self.addressed is False:
+                self.stats["unaddressed_bytes"] += 1
+                return
+
+        if byte in b"\r\n":
+            return
+
+        # Device control instructions are acted on as they arrive, without
+        # going through the buffer
+        if self.partial.startswith(b"\x1b") or byte == b"\x1b":
+            self.partial += byte
+            if self._device_control_complete(self.partial):
+                self._device_control(self.partial)
+                self.partial = b""
+            return
+
+        self._run(self.clock)
+        if self.free_space <= 0:
+            if self.handshake is True:
+                # The link holds the byte back until there's room
+                stalled = self.clock
+                self._run_until_space()
+                self.stats["stall_time"] += self.clock - stalled
+            else:
+                self.stats["lost_bytes"] += 1
+                return
+
+        self.partial += byte
+        if byte == b";":
+            self.buffer.append((self.clock, self.partial))
+            self.buffered_bytes += len(self.partial)
+            self.partial = b""
+
+    def _controller_command(self, line):
+        self.stats["controller_commands"] += 1
+        if line.startswith(b"++addr"):
+            addr = int(line[len(b"++addr"):].strip())
+            self.addressed = addr == self.addr
+
+    def _device_control_complete(self, sequence):
+        if len(sequence) < 3:
+            return False
+        if sequence[2:3] in PARAMETER_ESCAPES:
+            return sequence.endswith(b":")
+        return True
+
+    def _device_control(self, sequence):
+        self.stats["device_controls"] += 1
+        if sequence == b"\x1b.B":
+            self._reply(str(self.buffer_size).encode("ascii"), self.clock)
+        elif sequence == b"\x1b.L":
+            self._run(self.clock)
+            self._reply(str(self.free_space).encode("ascii"), self.clock)
+
+    def _reply(self, value, when):
+        self.replies.append((when, value + b"\r"))
+
+    def _run_until_space(self):
+        while self.free_space <= 0 and len(self.buffer) > 0:
+            self.clock = max(self.clock, self.busy_until)
+            self._run(self.clock)
+
+    def _run(self, until):
+        """Carry out every buffered command the plotter would have started by
+        time `until`"""
+        while len(self.buffer) > 0:
+            arrived, command = self.buffer[0]
+            start = max(arrived, self.busy_until)
+            if start > until:
+                break
+            self.buffer.popleft()
+            self.buffered_bytes -= len(command)
+            self.busy_until = start + self.command_time + self._execute(
+                command, start)
+
+    def _execute(self, command, when):
+        """Act on a single command and return how long the pen is busy"""
+        opcode = command[:2].upper()
+        self.stats["commands"] += 1
+        self.stats["command_" + opcode.decode("ascii", "replace")] += 1
+
+        if opcode == b"OS":
+            self._reply(b"24", when)
+            return 0.0
+        if opcode == b"OI":
+            self._reply(self.model, when)
+            return 0.0
+        if opcode == b"OF":
+            self._reply(b"40,40", when)
+            return 0.0
+        if opcode == b"IN":
+            self.pen_down = False
+            return 0.0
+        if opcode == b"SP":
+            self.pen = int(command[2:-1] or 0)
+            return self._pen_up()
+        if opcode in [b"PU", b"PD", b"PA"]:
+            duration = 0.0
+            if opcode == b"PU":
+                duration += self._pen_up()
+            elif opcode == b"PD":
+                duration += self._pen_lower()
+            values = [int(float(v)) for v in command[2:-1].split(b",")
+                      if len(v.strip()) > 0]
+            for x, y in zip(values[0::2], values[1::2]):
+                duration += self._move_to(x, y)
+            return duration
+        if opcode == b"CI":
+            radius = float(command[2:-1].split(b",")[0])
+            distance = 2 * math.pi * radius
+            self.stats["pen_down_distance"] += distance
+            return self._pen_lower() + distance / self.pen_speed
+        if opcode == b"PE":
+            if self.model == b"7475A":
+                self.stats["errors"] += 1
+                return 0.0
+            points, down = hpgl_pe.decode_pe(command, start=(self.x, self.y))
+            duration = 0.0
+            for (x, y), pen_down in zip(points, down):
+                if pen_down:
+                    duration += self._pen_lower()
+                else:
+                    duration += self._pen_up()
+                duration += self._move_to(x, y)
+            return duration
+
+        self.stats["errors"] += 1
+        return 0.0
+
+    def _pen_up(self):
+        if self.pen_down is False:
+            return 0.0
+        self.pen_down = False
+        self.stats["pen_lifts"] += 1
+        return self.pen_lift_time
+
+    def _pen_lower(self):
+        if self.pen_down is True:
+            return 0.0
+        self.pen_down = True
+        return self.pen_lift_time
+
+    def _move_to(self, x, y):
+        distance = np.hypot(x - self.x, y - self.y)
+        self.x = x
+        self.y = y
+        if self.pen_down is True:
+            self.stats["pen_down_distance"] += distance
+        else:
+            self.stats["pen_up_distance"] += distance
+        return distance / self.pen_speed
@@ -0,0 +1,116 @@
+"""Turn a closed loop of points into a smooth curve with as few points as it
+needs.
+
+Evaluating a spline at evenly spaced parameters puts as many points on a
+straight run as on a hairpin.  Here the spacing follows the curvature: an
+arc of length L and curvature k strays about k L^2 / 8 from its chord, so
+points are placed that far apart for the chord error to come out at the
+tolerance.  Any chord that still strays too far, measured at a few points
+along it, is then split in two, a whole batch of chords at a time, until
+none do.
+
+One periodic splprep() over tens of thousands of points is slow and can go
+wrong numerically, so long loops are cut into pieces that are fitted
+separately.  Each piece is fitted with a few extra points either side, so
+its ends curve the way the neighbouring pieces do, and is only sampled
+between its own first and last points, where it meets its neighbours.
+"""
+import numpy as np
+import scipy.interpolate
+
+# Loops with more points than this are fitted piece by piece, in pieces of
+# this many points
+PIECE_POINTS = 1000
+
+# Extra points fitted on each side of a piece
+PIECE_OVERLAP = 8
+
+# Rounds of splitting chords that are still too far from the curve
+MAX_REFINEMENTS = 12
+
+# Points at which curvature is measured, per point the spline was fitted to
+PROBES_PER_POINT = 4
+
+
+def _curvature_spacing(tck, u, tolerance):
+    """The parameter step at each of u that keeps the chord error to about
+    tolerance"""
+    dx, dy = scipy.interpolate.splev(u, tck, der=1)
+    ddx, ddy = scipy.interpolate.splev(u, tck, der=2)
+    speed = np.maximum(np.hypot(dx, dy), 1e-12)
+    curvature = np.abs(dx * ddy - dy * ddx) / speed ** 3
+
+    length = np.sqrt(8 * tolerance / np.maximum(curvature, 1e-12))
+    return length / speed
+
+
+def sample_adaptive(tck, u0, u1, tolerance, fitted_points):
+    """Evaluate the spline tck between parameters u0 and u1 at points close
+    enough together that no chord between them strays more than tolerance
+    from the curve.  fitted_points is how many points the spline was fitted
+    to, which sets how closely the curvature is looked at.  Straight runs
+    can go past several of them without a sample."""
+    # Place samples by curvature.  Each probe interval needs about
+    # (its width / the step there) samples.
+    probes = np.linspace(u0, u1, PROBES_PER_POINT * fitted_points + 1)
+    step = _curvature_spacing(tck, probes, tolerance)
+    needed = np.diff(probes) / np.minimum(step[:-1], step[1:])
+    cumulative = np.concatenate([[0], np.cumsum(needed)])
+    count = int(np.ceil(cumulative[-1])) + 1
+    u = np.interp(np.linspace(0, cumulative[-1], count), cumulative, probes)
+
+    # Split any chord that is still too far from the curve, measured at its
+    # middle and a quarter of the way in from each end
+    points = np.column_stack(scipy.interpolate.splev(u, tck))
+    for _ in range(MAX_REFINEMENTS):
+        width = np.diff(u)
+        error = np.zeros(len(width))
+        for f in [0.25, 0.5, 0.75]:
+            on_curve = np.column_stack(
+                scipy.interpolate.splev(u[:-1] + f * width, tck))
+            on_chord = points[:-1] + f * (points[1:] - points[:-1])
+            error = np.maximum(error, np.hypot(*(on_curve - on_chord).T))
+        bad = error > tolerance
+        if not np.any(bad):
+            break
+
+        middle = u[:-1][bad] + width[bad] / 2
+        added = np.column_stack(scipy.interpolate.splev(middle, tck))
+        order = np.argsort(np.concatenate([u, middle]), kind="mergesort")
+        u = np.concatenate([u, middle])[order]
+        points = np.concatenate([points, added])[order]
+
+    return points
+
+
+def _pieces(n, piece_points):
+    """(first, count) for pieces covering a loop of n points"""
+    starts = np.arange(0, n, piece_points)
+    counts = np.minimum(piece_points, n - starts)
+    return zip(starts.tolist(), counts.tolist())
+
+
+def sample_closed_curve(points, tolerance, piece_points=PIECE_POINTS):
+    """Fit a smooth closed curve through an (n, 2) array of points and
+    return an (m, 2) array of points along it, ending where it started"""
+    # splprep() can write to the array it's given, so give it a copy
+    points = np.array(points, dtype=float)
+    n = len(points)
+
+    if n <= 2 * piece_points:
+        tck, u = scipy.interpolate.splprep(points.T, u=None, s=0.0, per=1)
+        return sample_adaptive(tck, u.min(), u.max(), tolerance, n + 1)
+
+    sampled = []
+    for first, count in _pieces(n, piece_points):
+        idx = np.arange(first - PIECE_OVERLAP,
+                        first + count + PIECE_OVERLAP + 1) % n
+        tck, u = scipy.interpolate.splprep(points[idx].T, u=None, s=0.0)
+        piece = sample_adaptive(tck, u[PIECE_OVERLAP],
+                                u[PIECE_OVERLAP + count], tolerance,
+                                count + 1)
+        # The last point is the first point of the next piece
+        sampled.append(piece[:-1])
+
+    sampled.append(points[:1])
+    return np.concatenate(sampled)
@@ -0,0 +1,76 @@
+"""Even out randomly placed points with weighted Lloyd relaxation.
+
+Points sampled at random by darkness clump together in some places and leave
+gaps in others.  Each round of relaxation gives every pixel to the point
+nearest it, then moves each point to the darkness weighted centroid of its
+pixels, which is the weighted centroidal Voronoi stippling of Secord (2002).
+A few rounds leave the points spread out evenly, but still denser where the
+image is darker.
+
+Pixels are handed out with a cKDTree query over every inked pixel at once,
+which runs on all cores, and centroids are added up with np.bincount, so a
+round is a couple of numpy passes over the image.  The density is read a
+tile at a time, as it is for sampling.
+"""
+import logging
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def _nearest(tree, x, jobs):
+    """tree.query(x) using `jobs` threads.  The keyword for this changed
+    from n_jobs to workers in scipy 1.6."""
+    try:
+        return tree.query(x, workers=jobs)[1]
+    except TypeError:
+        return tree.query(x, n_jobs=jobs)[1]
+
+
+def lloyd_step(points, tiles, jobs=-1):
+    """Move each point to the centroid of the pixels nearest it, weighted by
+    density.  `tiles` is called to get an iterator over (first row, density)
+    as for sampling.sample_tiled.  Points that no inked pixel is nearest to
+    stay where they are."""
+    n = len(points)
+    tree = cKDTree(points)
+    weight = np.zeros(n)
+    row_sum = np.zeros(n)
+    col_sum = np.zeros(n)
+
+    for top, tile in tiles():
+        rows, cols = np.nonzero(tile)
+        if len(rows) == 0:
+            continue
+        w = tile[rows, cols].astype(float)
+        rows = rows + top
+        nearest = _nearest(tree, np.column_stack([rows, cols]), jobs)
+        weight += np.bincount(nearest, weights=w, minlength=n)
+        row_sum += np.bincount(nearest, weights=w * rows, minlength=n)
+        col_sum += np.bincount(nearest, weights=w * cols, minlength=n)
+
+    moved = np.array(points, dtype=float)
+    owned = weight > 0
+    moved[owned, 0] = row_sum[owned] / weight[owned]
+    moved[owned, 1] = col_sum[owned] / weight[owned]
+    return moved
+
+
+def relax(points, tiles, iterations, jobs=-1):
+    """Run `iterations` rounds of weighted Lloyd relaxation over the points,
+    and return where they end up"""
+    points = np.asarray(points, dtype=float)
+    if len(points) == 0:
+        return points
+
+    for i in range(iterations):
+        moved = lloyd_step(points, tiles, jobs=jobs)
+        shift = np.hypot(*(moved - points).T)
+        logging.debug("Relaxation round {}: points moved {:.3f} pixels on "
+                      "average, {:.3f} at most".format(i + 1, shift.mean(),
+                                                       shift.max()))
+        points = moved
+
+    logging.info("Relaxed {} points over {} rounds".format(len(points),
+                                                           iterations))
+    return points
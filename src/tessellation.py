@@ -0,0 +1,166 @@
+"""Voronoi tessellations of points scattered over an image, as line segments.
+
+voronoi_segments() turns one scipy Voronoi into segments clipped to the image.
+tiled_voronoi_segments() gets the same segments for point sets too big for one
+Qhull run.  The image is cut into square tiles, and each tile is tessellated
+in a worker process along with a halo of the points around it.  A tile keeps
+only the ridges it owns, the ones whose lower numbered generating point is in
+the tile itself, so every ridge comes out exactly once.
+
+A ridge only depends on the points near it, so it comes out the same as it
+would from the whole tessellation as long as no point outside the halo could
+be closer to any part of it than its generating points are.  Every kept ridge
+is checked for this, and a tile that fails is tried again with a halo twice
+as wide, until the halo covers the whole image if need be.
+"""
+import logging
+
+import numpy as np
+from scipy.spatial import Voronoi
+
+import geometry
+import util
+
+# Shared with the worker processes by _init_worker: the points, which tile
+# each one is in, the image shape and the tile size
+_points = None
+_tile_of_point = None
+_shape = None
+_tile_size = None
+
+
+def voronoi_segments(vor, shape, return_ridges=False):
+    """Given a voronoi tesselation, return an (n, 2, 2) array of its line
+    segments clipped to the image.  Infinite ridges are extended outwards
+    from their one finite end until they're well off the image.  If
+    return_ridges is set, also return each segment's pair of generating
+    points, as indices into vor.points.
+    """
+    ridge_points = np.asarray(vor.ridge_points)
+    ridge_vertices = np.asarray(vor.ridge_vertices)
+
+    finite = np.all(ridge_vertices >= 0, axis=1)
+    finite_segments = vor.vertices[ridge_vertices[finite]]
+
+    # Each infinite ridge has a single finite end Voronoi vertex
+    pointidx = ridge_points[~finite]
+    simplex = ridge_vertices[~finite]
+    start = vor.vertices[simplex.max(axis=1)]
+
+    t = vor.points[pointidx[:, 1]] - vor.points[pointidx[:, 0]]  # tangent
+    t /= np.linalg.norm(t, axis=1)[:, None]
+    n = np.column_stack([-t[:, 1], t[:, 0]])  # normal
+
+    center = vor.points.mean(axis=0)
+    midpoint = vor.points[pointidx].mean(axis=1)
+    direction = np.sign(np.sum((midpoint - center) * n, axis=1))[:, None] * n
+
+    # Long enough to reach past the far corner of the image from anywhere
+    reach = (np.hypot(shape[0], shape[1]) +
+             np.linalg.norm(start - center, axis=1))[:, None]
+    infinite_segments = np.stack([start, start + direction * reach], axis=1)
+
+    segments = np.concatenate([finite_segments, infinite_segments])
+    segments, kept = geometry.clip_segments(segments, 0, 0, shape[0],
+                                            shape[1], return_index=True)
+    if return_ridges is False:
+        return segments
+
+    ridges = np.concatenate([ridge_points[finite], pointidx])
+    return segments, ridges[kept]
+
+
+def _init_worker(points, shape, tile_size):
+    global _points, _tile_of_point, _shape, _tile_size
+    _points = points
+    _shape = shape
+    _tile_size = tile_size
+    last = [int(np.ceil(shape[0] / float(tile_size))) - 1,
+            int(np.ceil(shape[1] / float(tile_size))) - 1]
+    _tile_of_point = np.minimum(np.floor(points / tile_size).astype(int),
+                                last)
+
+
+def _inside(lo, hi, region, shape):
+    """Whether boxes from lo to hi fit inside region, on every side where
+    region doesn't reach the edge of the image.  There are no points beyond
+    the image, so there's nothing to check there."""
+    (rmin, cmin), (rmax, cmax) = region
+    ok = np.ones(len(lo), dtype=bool)
+    if rmin > 0:
+        ok &= lo[:, 0] >= rmin
+    if cmin > 0:
+        ok &= lo[:, 1] >= cmin
+    if rmax < shape[0]:
+        ok &= hi[:, 0] <= rmax
+    if cmax < shape[1]:
+        ok &= hi[:, 1] <= cmax
+    return ok
+
+
+def _tile_segments(job):
+    """Tessellate one tile and its halo, and return the segments it owns"""
+    row, col, halo_width = job
+    points = _points
+    shape = np.asarray(_shape, dtype=float)
+
+    in_core = np.all(_tile_of_point == [row, col], axis=1)
+    if not np.any(in_core):
+        return np.zeros((0, 2, 2))
+    core_box = np.minimum(np.array([[row, col], [row + 1, col + 1]],
+                                   dtype=float) * _tile_size, shape)
+
+    while True:
+        halo = (np.maximum(core_box[0] - halo_width, 0),
+                np.minimum(core_box[1] + halo_width, shape))
+        whole = np.all(halo[0] <= 0) and np.all(halo[1] >= shape)
+        local = np.flatnonzero(np.all((points >= halo[0]) &
+                                      (points <= halo[1]), axis=1))
+
+        if len(local) >= 4:
+            vor = Voronoi(points[local])
+            segments, ridges = voronoi_segments(vor, shape, return_ridges=True)
+            ridges = local[ridges]
+
+            # Each ridge belongs to the tile holding its lower numbered point
+            owned = in_core[ridges.min(axis=1)]
+            segments = segments[owned]
+            ridges = ridges[owned]
+            if whole:
+                return segments
+
+            # Is every point on each segment closer to its generating points
+            # than anything outside the halo could be?  Checking both ends is
+            # enough, as the circles through both generators centred along a
+            # segment are all inside the two at its ends.
+            generator = points[ridges[:, 0]]
+            ok = np.ones(len(segments), dtype=bool)
+            for end in [segments[:, 0], segments[:, 1]]:
+                r = np.hypot(*(end - generator).T)[:, None]
+                ok &= _inside(end - r, end + r, halo, shape)
+            if np.all(ok):
+                return segments
+        elif whole:
+            return np.zeros((0, 2, 2))
+
+        halo_width *= 2
+
+
+def tiled_voronoi_segments(points, shape, tile_size, workers=None):
+    """The segments voronoi_segments would give for Voronoi(points), worked
+    out tile by tile in parallel.  points are (row, column) in an image of
+    `shape`, and tiles are tile_size pixels square."""
+    points = np.asarray(points, dtype=float)
+    rows = int(np.ceil(shape[0] / float(tile_size)))
+    cols = int(np.ceil(shape[1] / float(tile_size)))
+
+    # Start the halo at a few times the average spacing between points
+    spacing = np.sqrt(shape[0] * shape[1] / float(max(len(points), 1)))
+
+    jobs = [(r, c, 4 * spacing) for r in range(rows) for c in range(cols)]
+    logging.info("Tessellating {} points in {} tiles".format(len(points),
+                                                            len(jobs)))
+    tiles = util.parallel_map(_tile_segments, jobs, workers=workers,
+                              initializer=_init_worker,
+                              initargs=(points, tuple(shape), tile_size))
+    return np.concatenate(tiles)
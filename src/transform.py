@@ -0,0 +1,88 @@
+"""Put drawings on the page, a whole array of coordinates at a time.
+
+A Transform scales, rotates and shifts drawing coordinates into plotter
+units, and rounds them to the integers the plotter takes.  It works on an
+(n, 2) array of points or an (n, 2, 2) array of segments in a single numpy
+pass, and drops the moves that rounding makes pointless: repeated points in
+a polyline, and segments that start and end on the same plotter unit.
+Polylines can also be simplified on the way, to a tolerance in plotter
+units.  fit() makes the Transform that fills a page with a drawing, less a
+margin.
+"""
+import numpy as np
+
+import simplify
+
+
+class Transform(object):
+    """Scale by `scale`, which may be different for x and y, then rotate
+    anticlockwise by `rotation` degrees about the origin, then move by
+    `offset`"""
+
+    def __init__(self, scale=1.0, rotation=0.0, offset=(0, 0)):
+        sx, sy = np.broadcast_to(np.asarray(scale, dtype=float), (2,))
+        theta = np.radians(rotation)
+        c, s = np.cos(theta), np.sin(theta)
+        self.matrix = np.array([[c * sx, -s * sy],
+                                [s * sx, c * sy]])
+        self.offset = np.asarray(offset, dtype=float)
+
+    def apply(self, coords):
+        """Transform an array whose last axis is (x, y)"""
+        coords = np.asarray(coords, dtype=float)
+        return np.dot(coords, self.matrix.T) + self.offset
+
+    def quantize(self, coords):
+        """Transform, and round to whole plotter units"""
+        return np.rint(self.apply(coords)).astype(int)
+
+    def to_segments(self, segments):
+        """Quantize an (n, 2, 2) array of segments, dropping any that end
+        where they start"""
+        q = self.quantize(np.reshape(segments, (-1, 2, 2)))
+        return q[np.any(q[:, 0] != q[:, 1], axis=1)]
+
+    def to_polylines(self, lines, tolerance=0):
+        """Quantize a list of (k, 2) polylines together, dropping points that
+        land on the same plotter unit as the point before them.  With a
+        tolerance, in plotter units, lines are simplified first."""
+        lines = [np.reshape(line, (-1, 2)) for line in lines]
+        if len(lines) == 0:
+            return []
+        lengths = np.array([len(line) for line in lines])
+        coords = self.apply(np.concatenate(lines))
+        line_of_point = np.repeat(np.arange(len(lines)), lengths)
+
+        if tolerance > 0:
+            keep = simplify.rdp_mask(coords, lengths, tolerance)
+            coords = coords[keep]
+            line_of_point = line_of_point[keep]
+        q = np.rint(coords).astype(int)
+
+        keep = np.ones(len(q), dtype=bool)
+        keep[1:] = (np.any(q[1:] != q[:-1], axis=1) |
+                    (line_of_point[1:] != line_of_point[:-1]))
+        line_of_point = line_of_point[keep]
+
+        kept = np.bincount(line_of_point, minlength=len(lines))
+        return np.split(q[keep], np.cumsum(kept)[:-1])
+
+
+def fit(bounds, page, margin=0, rotation=0.0):
+    """The Transform that rotates a drawing covering `bounds`, then makes it
+    as big as it can be without changing its shape and centres it on `page`,
+    keeping `margin` clear all round.  bounds and page are both
+    ((xmin, xmax), (ymin, ymax))."""
+    (x0, x1), (y0, y1) = bounds
+    corners = np.array([[x0, y0], [x0, y1], [x1, y0], [x1, y1]], dtype=float)
+    rotated = Transform(rotation=rotation).apply(corners)
+    low = rotated.min(axis=0)
+    high = rotated.max(axis=0)
+
+    (px0, px1), (py0, py1) = page
+    room = np.array([px1 - px0, py1 - py0], dtype=float) - 2 * margin
+    scale = np.min(room / np.maximum(high - low, 1e-12))
+
+    middle = np.array([px0 + px1, py0 + py1]) / 2.0
+    offset = middle - scale * (low + high) / 2.0
+    return Transform(scale=scale, rotation=rotation, offset=offset)
@@ -1,6 +1,9 @@
 import logging
+import multiprocessing
 import sys
 
+import numpy as np
+
 def rgb2gray(rgb):
     """Given an (nx x ny x 3) array, flatten it into a greyscale image
 
@@ -11,6 +14,46 @@ def rgb2gray(rgb):
     return gray
 
 
+def rgb2cmyk(rgb):
+    """Given an (nx x ny x 3) array, split it into cyan, magenta, yellow and
+    black separations
+
+    Each separation is returned as its own greyscale image, dark where that
+    ink is needed, so it can be drawn in the same way as a greyscale image.
+    Black is taken out of the other three as far as it can be.
+    """
+    rgb = rgb[:,:,:3] / 255.0
+    k = 1 - rgb.max(axis=2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cmy = (1 - rgb - k[:,:,None]) / (1 - k[:,:,None])
+    cmy[k == 1] = 0
+    inks = [cmy[:,:,0], cmy[:,:,1], cmy[:,:,2], k]
+    return [255 * (1 - ink) for ink in inks]
+
+
+def parallel_map(function, jobs, workers=None, initializer=None,
+                 initargs=()):
+    """map(function, jobs) over a pool of `workers` processes, one per CPU by
+    default.  With one worker or one job, or inside a worker process, which
+    can't start processes of its own, the jobs are run one after another in
+    this process instead."""
+    jobs = list(jobs)
+    if (workers == 1 or len(jobs) <= 1 or
+            multiprocessing.current_process().daemon):
+        if initializer is not None:
+            initializer(*initargs)
+        return [function(job) for job in jobs]
+
+    pool = multiprocessing.Pool(
+        min(len(jobs), workers or multiprocessing.cpu_count()),
+        initializer=initializer, initargs=initargs)
+    try:
+        return pool.map(function, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def init_logger(verbose=False):
     """Sets up logging for this cli"""
     log_level = logging.DEBUG if verbose is True else logging.INFO
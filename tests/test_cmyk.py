@@ -0,0 +1,38 @@
+import re
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+from PIL import Image
+import pytest
+
+from curve_drawing import CurveDrawing
+from voronoi_drawing import VoronoiDrawing
+
+
+@pytest.fixture
+def grey_rgb_image(tmpdir):
+    """An RGB file with nothing but greys in it, so its cyan, magenta and
+    yellow separations are empty"""
+    grey = np.tile(np.linspace(0, 255, 160), (120, 1)).astype(np.uint8)
+    filename = str(tmpdir.join("grey.png"))
+    Image.fromarray(np.dstack([grey, grey, grey])).save(filename)
+    return filename
+
+
+@pytest.mark.parametrize("drawing, count", [(VoronoiDrawing, "300"),
+                                            (CurveDrawing, "--points=300")])
+def test_cmyk_with_empty_separations(drawing, count, grey_rgb_image, tmpdir,
+                                     monkeypatch):
+    output = str(tmpdir.join("out.hpgl"))
+    monkeypatch.setattr("sys.argv", [
+        "drawing", grey_rgb_image, count, "--cmyk", "--pens=5,6,7,8",
+        "--seed=1", "--no-cache", "--output=" + output])
+    monkeypatch.setattr("builtins.input", lambda prompt: "y")
+    drawing()
+
+    with open(output, "rb") as f:
+        hpgl = f.read()
+    # Only black has any ink, so only its pen is picked up
+    assert re.findall(rb"SP(\d+);", hpgl) == [b"1", b"8", b"0"]
+    assert b"PD" in hpgl
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from hpgl_pe import decode_pe, encode_pe
+
+
+POLYLINES = [
+    [(0, 0), (0, 0)],
+    [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)],
+    [(5, 5), (-5, -5), (-1, 1), (1, -1)],
+    [(-10000, -10000), (10000, 10000), (-32768, 32767), (0, 0)],
+    [(16640, 10365), (0, 0), (2 ** 30, -2 ** 30), (-2 ** 30, 2 ** 30)],
+    [(100, 200)],
+]
+
+
+@pytest.mark.parametrize("seven_bit", [True, False])
+@pytest.mark.parametrize("points", POLYLINES)
+def test_round_trip(points, seven_bit):
+    data = encode_pe(points, seven_bit=seven_bit)
+    decoded, pen_down = decode_pe(data)
+    assert decoded.tolist() == [list(p) for p in points]
+    assert pen_down.tolist() == [False] + [True] * (len(points) - 1)
+
+
+@pytest.mark.parametrize("seven_bit", [True, False])
+def test_round_trip_random(seven_bit):
+    rs = np.random.RandomState(0)
+    points = rs.randint(-20000, 20000, size=(500, 2))
+    decoded, _ = decode_pe(encode_pe(points, seven_bit=seven_bit))
+    assert np.array_equal(decoded, points)
+
+
+def test_seven_bit_is_printable():
+    data = encode_pe([(-32768, 32767), (32767, -32768)], seven_bit=True)
+    assert all(32 < byte < 127 for byte in data)
+
+
+def test_base_64_is_shorter():
+    points = np.random.RandomState(1).randint(-5000, 5000, size=(100, 2))
+    assert (len(encode_pe(points, seven_bit=False)) <
+            len(encode_pe(points, seven_bit=True)))
+
+
+def test_single_digit_values():
+    # Zero is a lone terminator, and so are small values either side of it
+    assert encode_pe([(0, 0)]) == b"PE7<=__;"
+    assert encode_pe([(0, 0)], seven_bit=False) == b"PE<=\xbf\xbf;"
+    assert encode_pe([(1, -1)]) == b"PE7<=ab;"
+
+
+def test_empty():
+    assert encode_pe([]) == b"PE;"
+    decoded, pen_down = decode_pe(b"PE;")
+    assert len(decoded) == 0 and len(pen_down) == 0
@@ -0,0 +1,36 @@
+import numpy as np
+
+from pipeline import PlotPipeline, chunk_polylines
+from plotter import Plotter
+
+
+def draw(plotter):
+    rs = np.random.RandomState(1)
+    long_line = np.cumsum(rs.normal(size=(20000, 2)), axis=0)
+    short_lines = list(np.cumsum(rs.normal(size=(300, 7, 2)), axis=1))
+    plotter.set_image_scale((500, 500))
+    plotter.write_polylines([long_line] + short_lines)
+    plotter.select_pen(2)
+    plotter.write_segments(rs.uniform(0, 500, size=(5000, 2, 2)))
+    plotter.write_circle((100, 100), 30)
+
+
+def test_same_output_as_plotter(tmpdir):
+    direct = str(tmpdir.join("direct.hpgl"))
+    piped = str(tmpdir.join("piped.hpgl"))
+    with Plotter(output=direct, simplify=1.0) as p:
+        draw(p)
+    with Plotter(output=piped, simplify=1.0) as p:
+        with PlotPipeline(p) as q:
+            draw(q)
+    with open(direct, "rb") as a, open(piped, "rb") as b:
+        assert a.read() == b.read()
+
+
+def test_chunks_join_up():
+    line = np.arange(20).reshape(10, 2)
+    chunks = list(chunk_polylines([line, line[:1]], chunk_points=4))
+    pieces = [piece for chunk in chunks for piece in chunk]
+    assert [len(piece) for piece in pieces] == [5, 5, 2, 1]
+    assert np.array_equal(np.concatenate([pieces[0], pieces[1][1:],
+                                          pieces[2][1:]]), line)
@@ -0,0 +1,59 @@
+import pytest
+
+from plotter_link import PlotterLink, PlotterTimeoutError
+
+
+class SlowPort(object):
+    """Answers each query with a number counting up, `delays` seconds of
+    virtual time after it's asked"""
+
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.clock = 0.0
+        self.asked = 0
+        self.replies = []
+
+    def write(self, data):
+        self.asked += 1
+        delay = self.delays.pop(0) if self.delays else 0.0
+        if delay is not None:
+            self.replies.append((self.clock + delay,
+                                 b"%d\r" % self.asked))
+
+    def sleep(self, seconds):
+        self.clock += seconds
+
+    @property
+    def in_waiting(self):
+        return sum(1 for t, _ in self.replies if t <= self.clock)
+
+    def readline(self):
+        return self.replies.pop(0)[1]
+
+    def reset_input_buffer(self):
+        self.replies = [r for r in self.replies if r[0] > self.clock]
+
+
+def link(port):
+    return PlotterLink(port, timeout=1.0, retries=2, sleep=port.sleep)
+
+
+def test_late_reply_is_not_read_as_the_next_answer():
+    # The first answer turns up late but before the query is asked again
+    port = SlowPort([1.5, 0.0])
+    plotter_link = link(port)
+    assert plotter_link.query(b"OS;") == b"1"
+    assert plotter_link.query(b"OS;") == b"2"
+    assert port.asked == 2
+
+
+def test_lost_reply_is_asked_again():
+    port = SlowPort([None, 0.0])
+    assert link(port).query(b"OS;") == b"2"
+
+
+def test_longer_timeout_for_one_query():
+    port = SlowPort([30.0])
+    assert link(port).query(b"OS;", timeout=60.0, retries=0) == b"1"
+    with pytest.raises(PlotterTimeoutError):
+        link(SlowPort([30.0])).query(b"OS;", retries=0)
@@ -0,0 +1,72 @@
+import pytest
+
+from benchmark_plotter import make_polylines
+from plotter import Plotter
+from simulated_plotter import SimulatedPlotter
+from transform import Transform
+
+
+def plot(device, **kwargs):
+    with Plotter(device=device, gpib=device.gpib, **kwargs) as p:
+        for line in make_polylines(60, 20, seed=0):
+            p.write_polyline(line)
+    device.finish()
+    return device
+
+
+@pytest.mark.parametrize("buffered", [False, True])
+@pytest.mark.parametrize("encoding", ["PD", "PE"])
+@pytest.mark.parametrize("model", [b"7475A", b"7550A"])
+def test_no_bytes_lost(buffered, encoding, model):
+    # Without a handshake on the link, anything sent to a full buffer is
+    # lost, so only the Plotter's own flow control keeps it from overflowing
+    device = SimulatedPlotter(model=model, handshake=False)
+    plot(device, buffered=buffered, encoding=encoding)
+
+    assert device.stats["lost_bytes"] == 0
+    assert device.stats["errors"] == 0
+    assert device.buffered_bytes == 0 and device.partial == b""
+    assert device.pen == 0
+    if encoding == "PE" and model == b"7550A":
+        assert device.stats["command_PE"] > 0
+        assert device.stats["command_PD"] == 0
+    else:
+        # The 7475A can't take PE, so the Plotter falls back to PD
+        assert device.stats["command_PE"] == 0
+        assert device.stats["command_PD"] > 0
+
+
+@pytest.mark.parametrize("encoding", ["PD", "PE"])
+def test_same_drawing(encoding):
+    reference = plot(SimulatedPlotter(model=b"7550A"), encoding="PD")
+    device = plot(SimulatedPlotter(model=b"7550A"), buffered=True,
+                  encoding=encoding)
+    assert device.stats["pen_down_distance"] == pytest.approx(
+        reference.stats["pen_down_distance"])
+
+
+@pytest.mark.parametrize("handshake", ["xonxoff", "rtscts"])
+def test_handshake_device_control(handshake):
+    # Over RS-232 the Plotter sets the plotter's handshake with ESC.P, which
+    # runs on to a colon and mustn't spill into the commands after it
+    device = SimulatedPlotter(gpib=False)
+    plot(device, handshake=handshake, buffered=True)
+
+    assert device.stats["device_controls"] > 1
+    assert device.stats["command_OI"] == 1
+    assert device.stats["errors"] == 0
+
+
+def test_status_poll_waits_for_queued_drawing():
+    # Over GPIB the OS; poll joins the back of the buffer, behind strokes
+    # that take far longer than the reply timeout to draw
+    device = SimulatedPlotter()
+    with Plotter(device=device, buffered=True, timeout=5.0) as p:
+        p.set_transform(Transform())
+        for y in range(0, 7000, 20):
+            p.write_polyline([(0, y), (10000, y)])
+    device.finish()
+
+    assert device.clock > 300
+    assert device.stats["lost_bytes"] == 0
+    assert device.stats["command_PD"] == 350